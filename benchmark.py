@@ -0,0 +1,411 @@
+#benchmark haye finallll.py roye data ye sakhtegi
+#  python benchmark.py snapshot [--users N] [--posts N]
+#  python benchmark.py memory [--users N] [--posts N]
+#  python benchmark.py graph [--users N] [--follows N]
+#  python benchmark.py stats [--users N] [--posts N]
+#  python benchmark.py service [--sessions N] [--actions N]
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import finallll as app
+
+
+def build_dataset(n_users: int, n_posts: int, follows_per_user: int = 50, likes_per_post: int = 20, seed: int = 1):
+    """fill the app globals with a random social graph"""
+    rng = random.Random(seed)
+    app.unit_of_work.paused = True
+    names = [f"user{i}" for i in range(n_users)]
+    app.users = {}
+    app.graph.clear()
+    for name in names:
+        app.users[name] = app.User.restore({
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "secret123",
+            "bio": "",
+            "followers": [],
+            "following": [],
+            "posts": [],
+            "saved_posts": [],
+            "blocked_users": [],
+            "is_private": False,
+            "created_at": "2025-01-01T00:00:00",
+        })
+    for name in names:
+        for other in rng.sample(names, min(follows_per_user, n_users)):
+            if other != name:
+                app.graph.follow(name, other)
+
+    app.posts = app.PostStore()
+    for post_id in range(1, n_posts + 1):
+        author = rng.choice(names)
+        post = app.Post.restore({
+            "id": post_id,
+            "author": author,
+            "caption": f"caption number {post_id}",
+            "image_path": "",
+            "likes": rng.sample(names, min(likes_per_post, n_users)),
+            "comments": [],
+            "created_at": f"2025-01-01T00:{post_id // 60 % 60:02d}:{post_id % 60:02d}",
+        })
+        app.posts.add(post)
+        app.users[author].posts.append(post_id)
+    app.unit_of_work.paused = False
+
+
+def peak_rss_kb() -> int:
+    #ru_maxrss roye linux kilobyte va roye macOS byte hast
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def snapshot_child(fmt: str):
+    #to process joda ejra mishe ke peak RSS har format dorost andaze gerefte beshe
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    if fmt == "json":
+        loaded_users, loaded_posts = app.read_json_snapshot()
+    else:
+        loaded_users, loaded_posts = app.read_binary_snapshot(app.SNAPSHOT_FILE)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.4f} {before} {peak_rss_kb()} {len(loaded_users)} {len(loaded_posts)}")
+
+
+def run_child(*args) -> str:
+    return subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *args],
+        capture_output=True, text=True, check=True,
+        env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(app.__file__))),
+    ).stdout
+
+
+def snapshot_build(n_users: int, n_posts: int):
+    app.initialize_data_directory()
+    build_dataset(n_users, n_posts)
+    app.write_json_snapshot()
+    app.write_binary_snapshot(app.SNAPSHOT_FILE)
+
+
+class BaselineUser:
+    """User the way it was before __slots__, the graph and interning: a __dict__ and string lists each"""
+
+    def __init__(self, data):
+        self.username = data["username"]
+        self.email = data["email"]
+        self.password = data["password"]
+        self.bio = data["bio"]
+        self.followers = list(data["followers"])
+        self.following = list(data["following"])
+        self.posts = list(data["posts"])
+        self.saved_posts = list(data["saved_posts"])
+        self.blocked_users = list(data["blocked_users"])
+        self.is_private = data["is_private"]
+        self.created_at = data["created_at"]
+
+
+class BaselinePost:
+    def __init__(self, data):
+        self.id = data["id"]
+        self.author = data["author"]
+        self.caption = data["caption"]
+        self.image_path = data["image_path"]
+        self.likes = list(data["likes"])
+        self.comments = list(data["comments"])
+        self.created_at = data["created_at"]
+
+
+def traced_load(path: str, build) -> int:
+    #faghat object haye sakhte shode hesab mishan, na json khoonde shode
+    tracemalloc.start()
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    kept = build(raw)
+    del raw
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def memory_child(mode: str):
+    app.unit_of_work.paused = True
+    if mode == "baseline":
+        users_bytes = traced_load(app.USERS_FILE, lambda raw: {name: BaselineUser(data) for name, data in raw.items()})
+        posts_bytes = traced_load(app.POSTS_FILE, lambda raw: [BaselinePost(data) for data in raw])
+    else:
+        users_bytes = traced_load(app.USERS_FILE, lambda raw: {name: app.User.from_dict(data) for name, data in raw.items()})
+        posts_bytes = traced_load(app.POSTS_FILE, lambda raw: app.PostStore.from_posts([app.Post.from_dict(data) for data in raw]))
+    print(f"{users_bytes} {posts_bytes}")
+
+
+def bench_memory(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        run_child("snapshot-build", str(args.users), str(args.posts))
+        print(f"dataset: {args.users} users, {args.posts} posts")
+        print(f"{'entities':<30} {'bytes/user':>11} {'bytes/post':>11}")
+        for mode, label in (("baseline", "before (__dict__, str copies)"), ("current", "after (current entities)")):
+            users_bytes, posts_bytes = map(int, run_child("memory-child", mode).split())
+            print(f"{label:<30} {users_bytes / args.users:>11.0f} {posts_bytes / args.posts:>11.0f}")
+
+
+class ListGraph:
+    """follow lists of username strings on every user, the way User kept them before the graph"""
+
+    def __init__(self, names):
+        self.following = {name: [] for name in names}
+        self.followers = {name: [] for name in names}
+
+    def follow(self, username: str, other: str):
+        if other not in self.following[username]:
+            self.following[username].append(other)
+            self.followers[other].append(username)
+
+    def follower_count(self, username: str) -> int:
+        return len(self.followers[username])
+
+    def friends_of_friends(self, username: str, limit: int = 10):
+        following = set(self.following[username])
+        counts = Counter(other for followed in following for other in self.following[followed])
+        return [other for other, _ in counts.most_common() if other != username and other not in following][:limit]
+
+
+def graph_child(backend: str, n_users: int, follows: int):
+    rng = random.Random(1)
+    names = [f"user{i}" for i in range(n_users)]
+    edges = [(names[u], names[v]) for u in range(n_users) for v in rng.sample(range(n_users), follows) if v != u]
+    sample = rng.sample(names, min(500, n_users))
+    app.unit_of_work.paused = True
+
+    def build_graph():
+        graph = ListGraph(names) if backend == "lists" else app.make_graph(backend)
+        for username, other in edges:
+            graph.follow(username, other)
+        if backend == "csr":
+            graph._following.merge()
+            graph._followers.merge()
+        return graph
+
+    #tracemalloc allocation ha ro kond mikone, pas zaman va hafeze do ta build joda an
+    tracemalloc.start()
+    graph = build_graph()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del graph
+    app.user_ids = app.UserIds()
+    gc.collect()
+
+    start = time.perf_counter()
+    graph = build_graph()
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in names:
+        graph.follower_count(name)
+    degree = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in names:
+        for _ in graph.following[name] if backend == "lists" else graph.following(name):
+            pass
+    neighbors = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in sample:
+        graph.friends_of_friends(name)
+    fof = time.perf_counter() - start
+    print(f"{size} {build:.4f} {degree:.4f} {neighbors:.4f} {fof / len(sample):.6f}")
+
+
+def bench_graph(args):
+    print(f"graph: {args.users} users, {args.follows} follows each")
+    print(f"{'backend':<8} {'MB':>8} {'build s':>8} {'degree us':>10} {'iterate s':>10} {'fof ms':>8}")
+    backends = ["lists", "sets"] + (["csr"] if app.np is not None else [])
+    for backend in backends:
+        out = run_child("graph-child", backend, str(args.users), str(args.follows)).split()
+        size, build, degree, neighbors, fof = int(out[0]), *map(float, out[1:])
+        print(f"{backend:<8} {size / 1e6:>8.1f} {build:>8.2f} {degree / args.users * 1e6:>10.2f} "
+              f"{neighbors:>10.2f} {fof * 1e3:>8.2f}")
+
+
+def loop_stats(n: int = app.STATS_TOP_N):
+    """the same aggregates as EngagementStats, looping over Post objects"""
+    by_author = {}
+    by_day = {}
+    likes, comment_counts = [], []
+    for post in app.posts:
+        like_count, comment_count = post.like_count, app.comments.count(post.id)
+        likes.append(like_count)
+        comment_counts.append(comment_count)
+        totals = by_author.setdefault(post.author, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += like_count
+        totals[2] += comment_count
+        by_day.setdefault(post.created_at // 86400000000, []).append((-(like_count + comment_count), post.id))
+    likes.sort()
+    comment_counts.sort()
+    percentiles = [values[int(len(values) * p / 100)] for values in (likes, comment_counts) for p in (50, 90, 99)]
+    top_authors = sorted(by_author.items(), key=lambda item: -item[1][1])[:10]
+    top_days = {day: sorted(day_posts)[:n] for day, day_posts in by_day.items()}
+    return percentiles, top_authors, top_days
+
+
+def numpy_stats(stats):
+    return stats.summary(), stats.per_author(), stats.top_per_day()
+
+
+def bench_stats(args):
+    build_dataset(args.users, args.posts, follows_per_user=10)
+    rng = random.Random(2)
+    post_ids = app.posts.ids()
+    names = list(app.users)
+    for i in range(args.posts * 2):
+        app.comments.add({"id": i + 1, "post_id": rng.choice(post_ids), "author": rng.choice(names),
+                          "text": "nice", "created_at": "2025-01-01T00:00:00"})
+
+    print(f"dataset: {args.users} users, {args.posts} posts, {len(app.comments)} comments")
+    print(f"{'aggregates':<24} {'s':>8}")
+    start = time.perf_counter()
+    loop_stats()
+    print(f"{'python loop':<24} {time.perf_counter() - start:>8.3f}")
+    start = time.perf_counter()
+    stats = app.EngagementStats.build()
+    print(f"{'numpy: build columns':<24} {time.perf_counter() - start:>8.3f}")
+    start = time.perf_counter()
+    numpy_stats(stats)
+    print(f"{'numpy: aggregates':<24} {time.perf_counter() - start:>8.3f}")
+
+
+def service_session(name: str, names, actions: int, seed: int):
+    """one headless client: follows, posts, likes and comments through app.service"""
+    rng = random.Random(seed)
+    service = app.service
+    own_posts = []
+    for i in range(actions):
+        kind = i % 4
+        if kind == 0:
+            other = rng.choice(names)
+            if other != name:
+                service.follow(name, other)
+        elif kind == 1:
+            own_posts.append(service.create_post(name, f"post {i} from {name}").id)
+        else:
+            page, _ = service.feed(name)
+            post_id = page[0].id if page else (own_posts[-1] if own_posts else None)
+            if post_id is None:
+                continue
+            if kind == 2:
+                service.toggle_like(name, post_id)
+            else:
+                service.comment(name, post_id, "nice")
+
+
+def bench_service(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        app.initialize_data_directory()
+        app.open_storage()
+        app.load_data()
+        names = [f"user{i}" for i in range(args.sessions)]
+        for name in names:
+            app.service.register(name, f"{name}@example.com", "secret123")
+
+        threads = [threading.Thread(target=service_session, args=(name, names, args.actions, i))
+                   for i, name in enumerate(names)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        app.storage.close()
+
+    total = args.sessions * args.actions
+    print(f"backend {app.STORAGE_BACKEND}{' + write-behind' if app.WRITE_BEHIND else ''}: "
+          f"{args.sessions} sessions x {args.actions} actions")
+    print(f"{total} actions in {elapsed:.2f} s, {total / elapsed:.0f} actions/s")
+
+
+def bench_snapshot(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        #data ham to process joda sakhte mishe, chon ru_maxrss bache ha az process pedar ers mibare
+        run_child("snapshot-build", str(args.users), str(args.posts))
+        json_size = os.path.getsize(app.USERS_FILE) + os.path.getsize(app.POSTS_FILE)
+        binary_size = sum(os.path.getsize(path) for path in (app.SNAPSHOT_FILE, app.POSTS_DATA_FILE, app.POSTS_INDEX_FILE))
+
+        print(f"dataset: {args.users} users, {args.posts} posts")
+        print(f"{'format':<8} {'size MB':>9} {'load s':>8} {'peak RSS MB':>12} {'RSS growth MB':>14}")
+        for fmt, size in (("json", json_size), ("binary", binary_size)):
+            out = run_child("snapshot-child", fmt).split()
+            elapsed, before, peak = float(out[0]), int(out[1]), int(out[2])
+            print(f"{fmt:<8} {size / 1e6:>9.1f} {elapsed:>8.3f} {peak / 1024:>12.1f} {(peak - before) / 1024:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmarks for finallll.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = commands.add_parser("snapshot", help="startup time and peak RSS, json vs binary snapshot")
+    snapshot.add_argument("--users", type=int, default=20000)
+    snapshot.add_argument("--posts", type=int, default=50000)
+    snapshot.set_defaults(run=bench_snapshot)
+
+    build = commands.add_parser("snapshot-build")
+    build.add_argument("users", type=int)
+    build.add_argument("posts", type=int)
+    build.set_defaults(run=lambda args: snapshot_build(args.users, args.posts))
+
+    child = commands.add_parser("snapshot-child")
+    child.add_argument("format", choices=["json", "binary"])
+    child.set_defaults(run=lambda args: snapshot_child(args.format))
+
+    memory = commands.add_parser("memory", help="bytes per user and per post, before vs after __slots__/interning")
+    memory.add_argument("--users", type=int, default=20000)
+    memory.add_argument("--posts", type=int, default=50000)
+    memory.set_defaults(run=bench_memory)
+
+    memory_run = commands.add_parser("memory-child")
+    memory_run.add_argument("mode", choices=["baseline", "current"])
+    memory_run.set_defaults(run=lambda args: memory_child(args.mode))
+
+    graph = commands.add_parser("graph", help="follow graph memory and traversal: string lists vs IdSet vs numpy CSR")
+    graph.add_argument("--users", type=int, default=50000)
+    graph.add_argument("--follows", type=int, default=20)
+    graph.set_defaults(run=bench_graph)
+
+    graph_run = commands.add_parser("graph-child")
+    graph_run.add_argument("backend", choices=["lists", "sets", "csr"])
+    graph_run.add_argument("users", type=int)
+    graph_run.add_argument("follows", type=int)
+    graph_run.set_defaults(run=lambda args: graph_child(args.backend, args.users, args.follows))
+
+    stats = commands.add_parser("stats", help="engagement aggregates, python loop vs numpy columns")
+    stats.add_argument("--users", type=int, default=20000)
+    stats.add_argument("--posts", type=int, default=200000)
+    stats.set_defaults(run=bench_stats)
+
+    service = commands.add_parser("service", help="concurrent headless sessions through InstagramService")
+    service.add_argument("--sessions", type=int, default=8)
+    service.add_argument("--actions", type=int, default=500)
+    service.set_defaults(run=bench_service)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,81 +1,2547 @@
 import os 
+import base64
+import bisect
+import heapq
 import json
+import mmap
+import struct
+import sys
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict,List,Optional,Tuple
-from rich.console import Console
+from rich.console import Console, Group
 from rich.panel import Panel
 from rich.table import Table
 from rich.text import Text
 from rich.prompt import Prompt, Confirm
+try:
+    #numpy faghat baraye graph CSR (INSTAGRAM_GRAPH=csr) va amar (stats) lazem hast
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    #lock file baraye gereftan node id (faghat unix)
+    import fcntl
+except ImportError:
+    fcntl = None
 
 console= Console()
 
 users: Dict[str, Dict]={}
-posts: List[Dict]= []
+#posts ye PostStore hast, paeen tarif shode
 stories: List[Dict]=[]
-comments: List[Dict]= []
+#comments ye CommentStore hast, paeen tarif shode
 messages: List[Dict]= []
-follow_requests: List[Dict]= []
+#follow_requests ye FollowRequestStore hast, paeen tarif shode
 
 DATA_DIR= "data"
 USERS_FILE=os.path.join(DATA_DIR, "users.json")
 POSTS_FILE=os.path.join(DATA_DIR, "posts.json")
 STORIES_FILE=os.path.join(DATA_DIR, "stories.json")
-COMMENTS_FILE=os.path.join(DATA_DIR, "comments.json")
+#comment ha avaz nemishan, pas har comment faghat ye khat be akhar in file ezafe mikone
+COMMENTS_FILE=os.path.join(DATA_DIR, "comments.jsonl")
 MESSAGES_FILE=os.path.join(DATA_DIR, "messages.json")
+#snapshot request ha; taghirat beynesh mesl user ha to journal hastan
 FOLLOW_REQUESTS_FILE= os.path.join(DATA_DIR, "follow_requests.json")
 
-def load_data():
-    global users, posts, stories, comments, messages, follow_requests
-    
+JOURNAL_FILE= os.path.join(DATA_DIR, "journal.log")
+SQLITE_FILE= os.path.join(DATA_DIR, "instagram.db")
+#age in file bashe load_data() be jaye users.json/posts.json azash estefade mikone
+SNAPSHOT_FILE= os.path.join(DATA_DIR, "snapshot.bin")
+#ba binary snapshot post ha to in do file hastan va faghat vaghti lazem shan decode mishan
+POSTS_DATA_FILE= os.path.join(DATA_DIR, "posts.dat")
+POSTS_INDEX_FILE= os.path.join(DATA_DIR, "posts.idx")
+#chand ta post decode shode to hafeze mimoone
+POST_CACHE_SIZE= 2000
+#timeline har karbar hadaksar chand ta post dare va home chand ta post dar har safhe neshoon mide
+TIMELINE_SIZE= 500
+FEED_PAGE_SIZE= 10
+#display_post har bar chand ta comment neshoon mide
+COMMENT_PAGE_SIZE= 5
+#post haye kasi ke in tedad follower dare fan-out nemishan va moghe khoondan merge mishan
+CELEBRITY_FOLLOWERS= 10000
+#javab haye "V post haye A ro mibine?" ta in tedad cache mishan
+VISIBILITY_CACHE_SIZE= 100000
+#search_users hadaksar chand ta natije neshoon mide
+SEARCH_LIMIT= 20
+#ranking search: chand barabar limit az natije ha baraye hesab mutual ha negah dashte mishe
+#va har mutual chand ta follower hesab mishe
+SEARCH_RERANK= 5
+SEARCH_MUTUAL_WEIGHT= 10
+#like haye posti ke az in tedad bishtar beshe be bitmap roye id adadi user ha miran (0 yani khamoosh)
+LIKES_BITMAP_MIN= int(os.environ.get("INSTAGRAM_LIKES_BITMAP_MIN", "5000"))
+#container haye bitmap ta in tedad array morattab hastan, baad bitset 8KB
+BITMAP_ARRAY_MAX= 4096
+
+#id ha snowflake 64 biti hastan: 41 bit millisecond az ID_EPOCH_MS | 10 bit node | 12 bit sequence
+#node az INSTAGRAM_NODE_ID miyad; age nabood har process ye node azad to NODES_DIR ejare mikone
+ID_EPOCH_MS= 1704067200000
+ID_NODE= int(os.environ["INSTAGRAM_NODE_ID"]) & 0x3FF if "INSTAGRAM_NODE_ID" in os.environ else None
+NODES_DIR= os.path.join(DATA_DIR, "nodes")
+
+#kodoom backend baraye zakhire estefade beshe: "json" ya "sqlite"
+STORAGE_BACKEND= os.environ.get("INSTAGRAM_BACKEND", "json")
+
+#journal mode: har taghir faghat ye khat be journal ezafe mikone
+#va vaghti journal az in hajm bozorgtar shod to snapshot jam mishe
+USE_JOURNAL= True
+JOURNAL_COMPACT_SIZE= 4 * 1024 * 1024
+
+#write-behind: taghirat to saf mimoonan va ye thread har chand millisecond
+#ya har chand ta taghir yekja minevise (ekhtiari, pishfarz khamoosh)
+WRITE_BEHIND= os.environ.get("INSTAGRAM_WRITE_BEHIND", "") == "1"
+WRITE_BEHIND_INTERVAL_MS= 200
+WRITE_BEHIND_MAX_OPS= 1000
+
+#graph follow ha: "sets" (IdSet baraye har user) ya "csr" (araye haye numpy, baraye milion ha edge)
+GRAPH_BACKEND= os.environ.get("INSTAGRAM_GRAPH", "sets")
+#delta buffer CSR vaghti az in tedad (ya yek chaharom edge ha) bishtar shod merge mishe
+CSR_MERGE_EDGES= 100000
+
+#chand ta post bartar baraye har rooz, va amar chand rooz akhar neshoon dade beshe
+STATS_TOP_N= 3
+STATS_DAYS= 7
+
+#chand ta daghighe format shode ("YYYY-mm-dd HH:MM") baraye namayesh negah dashte beshe
+MINUTE_CACHE_SIZE= 1024
+
+
+#created_at dakhel barname microsecond az 1970 hast (int); ISO faghat moghe khoondan/neveshtan.
+#ISO ha bedoone timezone (saat mahalli) hastan, pas hamoon saat divari ro be adad tabdil mikonim
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_minute_labels: 'OrderedDict[int, str]' = OrderedDict()
+
+def now_us() -> int:
+    return (datetime.now() - _EPOCH) // _MICROSECOND
+
+def to_epoch_us(value) -> int:
+    """ISO string (or an int already) -> epoch microseconds"""
+    if isinstance(value, int):
+        return value
+    return (datetime.fromisoformat(value) - _EPOCH) // _MICROSECOND
+
+def to_iso(value: int) -> str:
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+def format_minute(value: int) -> str:
+    """epoch microseconds as "YYYY-mm-dd HH:MM"; a feed page only has a few distinct minutes"""
+    minute = value // 60000000
+    label = _minute_labels.get(minute)
+    if label is not None:
+        _minute_labels.move_to_end(minute)
+        return label
+    label = _minute_labels[minute] = (_EPOCH + timedelta(minutes=minute)).strftime("%Y-%m-%d %H:%M")
+    if len(_minute_labels) > MINUTE_CACHE_SIZE:
+        _minute_labels.popitem(last=False)
+    return label
+
+
+
+#record har post to posts.dat:
+#  id u64 | tool author, caption, image_path, created_at, likes (u32) | tedad comment (u32)
+#  | string ha (utf-8) | id comment ha (u64)
+#likes ba "\0" beham chasbide mishan chon username nemitoone \0 dashte bashe
+_POST_RECORD = struct.Struct("<Q6I")
+POSTS_INDEX_MAGIC = b"IGPIDX01"
+
+def encode_post(post: 'Post') -> bytes:
+    strings = [value.encode("utf-8") for value in
+               (post.author, post.caption, post.image_path, to_iso(post.created_at), "\0".join(post.likes))]
+    post_comments = array("Q", post.comments)
+    if sys.byteorder == "big":
+        post_comments.byteswap()
+    return b"".join([_POST_RECORD.pack(post.id, *map(len, strings), len(post_comments)),
+                     *strings, post_comments.tobytes()])
+
+def decode_post(buf, offset: int) -> 'Post':
+    post_id, *lengths, comment_count = _POST_RECORD.unpack_from(buf, offset)
+    offset += _POST_RECORD.size
+    values = []
+    for length in lengths:
+        values.append(str(buf[offset:offset + length], "utf-8"))
+        offset += length
+    author, caption, image_path, created_at, likes = values
+    post_comments = array("Q")
+    post_comments.frombytes(buf[offset:offset + 8 * comment_count])
+    if sys.byteorder == "big":
+        post_comments.byteswap()
+    return Post.restore({
+        "id": post_id,
+        "author": author,
+        "caption": caption,
+        "image_path": image_path,
+        "likes": likes.split("\0") if likes else [],
+        "comments": post_comments.tolist(),
+        "created_at": created_at,
+    })
+
+
+class PostStore:
+    """all posts by id; posts that live in posts.dat are decoded on first use"""
+
+    def __init__(self, cache_size: int = POST_CACHE_SIZE):
+        self.cache_size = cache_size
+        #post haye jadid, taghir karde, ya hame post ha vaghti data file nadarim
+        self._resident: Dict[int, 'Post'] = {}
+        #id post hayi ke to data file nistan, be tartib ezafe shodan
+        self._new_ids: List[int] = []
+        self._new_id_set = set()
+        #post haye salem (bedoone taghir) ke az data file decode shodan, LRU
+        self._cache: 'OrderedDict[int, Post]' = OrderedDict()
+        self._file_ids = array("Q")
+        self._file_offsets = array("Q")
+        self._file = None
+        self._data: Optional[mmap.mmap] = None
+        #har pin ba shomare compaction negah dashte mishe, bad az rewrite faghat
+        #pin haye ghadimi tar az shoroo compaction azad mishan
+        self._pin_epoch: Dict[int, int] = {}
+        self._epoch = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_posts(cls, items: List['Post']) -> 'PostStore':
+        store = cls()
+        for post in items:
+            store.add(post)
+        return store
+
+    @classmethod
+    def open(cls, data_path: str, index_path: str) -> 'PostStore':
+        store = cls()
+        store._open_files(data_path, index_path)
+        return store
+
+    def _open_files(self, data_path: str, index_path: str):
+        with open(index_path, "rb") as f:
+            buf = f.read()
+        if buf[:len(POSTS_INDEX_MAGIC)] != POSTS_INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not a post index")
+        (count,) = struct.unpack_from("<I", buf, len(POSTS_INDEX_MAGIC))
+        start = len(POSTS_INDEX_MAGIC) + 4
+        ids = array("Q")
+        ids.frombytes(buf[start:start + 8 * count])
+        offsets = array("Q")
+        offsets.frombytes(buf[start + 8 * count:start + 16 * count])
+        if sys.byteorder == "big":
+            ids.byteswap()
+            offsets.byteswap()
+
+        self._file = open(data_path, "rb")
+        #mmap roye file khali kar nemikone
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if count else None
+        self._file_ids = ids
+        self._file_offsets = offsets
+
+    def close(self):
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+                self._data = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _file_position(self, post_id: int) -> Optional[int]:
+        index = bisect.bisect_left(self._file_ids, post_id)
+        if index < len(self._file_ids) and self._file_ids[index] == post_id:
+            return index
+        return None
+
+    def __len__(self) -> int:
+        return len(self._file_ids) + len(self._new_ids)
+
+    def __contains__(self, post_id: int) -> bool:
+        return post_id in self._new_id_set or self._file_position(post_id) is not None
+
+    def ids(self) -> List[int]:
+        return self._file_ids.tolist() + self._new_ids
+
+    def last_id(self) -> int:
+        return max(self._file_ids[-1] if self._file_ids else 0, max(self._new_ids, default=0))
+
+    def get(self, post_id: int) -> Optional['Post']:
+        with self._lock:
+            post = self._resident.get(post_id)
+            if post is not None:
+                return post
+            post = self._cache.get(post_id)
+            if post is not None:
+                self._cache.move_to_end(post_id)
+                return post
+            index = self._file_position(post_id)
+            if index is None:
+                return None
+            post = decode_post(self._data, self._file_offsets[index])
+            self._cache[post_id] = post
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return post
+
+    def __getitem__(self, post_id: int) -> 'Post':
+        post = self.get(post_id)
+        if post is None:
+            raise KeyError(post_id)
+        return post
+
+    def _peek(self, post_id: int) -> 'Post':
+        #mesl get vali post decode shode ro to cache nemizare
+        with self._lock:
+            post = self._resident.get(post_id) or self._cache.get(post_id)
+            if post is None:
+                post = decode_post(self._data, self._file_offsets[self._file_position(post_id)])
+            return post
+
+    def __iter__(self):
+        #baraye snapshot/scan kamel, cache ro por nemikone
+        for post_id in self.ids():
+            yield self._peek(post_id)
+
+    def add(self, post: 'Post'):
+        with self._lock:
+            if post.id not in self._new_id_set and self._file_position(post.id) is None:
+                self._new_ids.append(post.id)
+                self._new_id_set.add(post.id)
+            self.pin(post)
+
+    def pin(self, post: 'Post'):
+        """keep a new or changed post in memory until it is written to the data file"""
+        with self._lock:
+            self._resident[post.id] = post
+            self._pin_epoch[post.id] = self._epoch
+            self._cache.pop(post.id, None)
+
+    def rewrite(self, data_path: str, index_path: str):
+        """write every post to a fresh data file and switch to reading from it"""
+        with self._lock:
+            self._epoch += 1
+            started = self._epoch
+        ids = sorted(self.ids())
+        offsets = array("Q")
+        offset = 0
+        with open(data_path + ".tmp", "wb") as f:
+            for post_id in ids:
+                record = encode_post(self._peek(post_id))
+                offsets.append(offset)
+                f.write(record)
+                offset += len(record)
+        ids = array("Q", ids)
+        header = POSTS_INDEX_MAGIC + struct.pack("<I", len(ids))
+        if sys.byteorder == "big":
+            ids.byteswap()
+            offsets.byteswap()
+        with open(index_path + ".tmp", "wb") as f:
+            f.write(header + ids.tobytes() + offsets.tobytes())
+
+        with self._lock:
+            self.close()
+            os.replace(data_path + ".tmp", data_path)
+            os.replace(index_path + ".tmp", index_path)
+            self._open_files(data_path, index_path)
+            self._new_ids = [post_id for post_id in self._new_ids if self._file_position(post_id) is None]
+            self._new_id_set = set(self._new_ids)
+            for post_id, epoch in list(self._pin_epoch.items()):
+                if epoch < started:
+                    post = self._resident.pop(post_id)
+                    del self._pin_epoch[post_id]
+                    self._cache[post_id] = post
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+posts: PostStore = PostStore()
+
+
+class CommentStore:
+    """comments indexed by id and by post"""
+
+    def __init__(self):
+        #id -> (post_id, id adadi author, text, created_at microsecond); dict faghat moghe khoondan sakhte mishe
+        self._by_id: Dict[int, Tuple[int, int, str, int]] = {}
+        #post id -> id comment ha, az ghadimi be jadid
+        self._by_post: Dict[int, List[int]] = {}
+        self._last_id = 0
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self):
+        return map(self._comment, list(self._by_id))
+
+    def _comment(self, comment_id: int) -> Dict:
+        post_id, author_id, text, created_at = self._by_id[comment_id]
+        return {"id": comment_id, "post_id": post_id, "author": user_ids.name_of(author_id),
+                "text": text, "created_at": to_iso(created_at)}
+
+    def get(self, comment_id: int) -> Optional[Dict]:
+        return self._comment(comment_id) if comment_id in self._by_id else None
+
+    def add(self, comment: Dict) -> bool:
+        if comment["id"] in self._by_id:
+            return False
+        self._by_id[comment["id"]] = (comment["post_id"], user_ids.id_of(comment["author"]),
+                                      comment["text"], to_epoch_us(comment["created_at"]))
+        self._last_id = max(self._last_id, comment["id"])
+        post_comments = self._by_post.setdefault(comment["post_id"], [])
+        if post_comments and post_comments[-1] > comment["id"]:
+            bisect.insort(post_comments, comment["id"])
+        else:
+            post_comments.append(comment["id"])
+        return True
+
+    def last_id(self) -> int:
+        return self._last_id
+
+    def post_ids(self) -> array:
+        """post id of every comment, for counting comments per post in bulk"""
+        return array("Q", [comment[0] for comment in self._by_id.values()])
+
+    def count(self, post_id: int) -> int:
+        return len(self._by_post.get(post_id, ()))
+
+    def latest(self, post_id: int, offset: int = 0, limit: int = COMMENT_PAGE_SIZE) -> List[Dict]:
+        """comments of a post newest first, skipping the offset newest ones"""
+        post_comments = self._by_post.get(post_id, [])
+        end = len(post_comments) - offset
+        return [self._comment(comment_id) for comment_id in reversed(post_comments[max(0, end - limit):max(0, end)])]
+
+    @classmethod
+    def load(cls, path: str) -> 'CommentStore':
+        store = cls()
+        if not os.path.exists(path):
+            return store
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        store.add(json.loads(line))
+                    except ValueError:
+                        console.print(f"[yellow]skipping broken comment at line {line_number}[/]")
+        except Exception as e:
+            console.print(f"[red]error in loading comments {e}[/]")
+        return store
+
+    @staticmethod
+    def append_to_file(path: str, new_comments: List[Dict]):
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(comment, ensure_ascii=False, separators=(",", ":")) + "\n"
+                                for comment in new_comments))
+        except Exception as e:
+            console.print(f"[red]error in saving comments {e}[/]")
+
+comments: CommentStore = CommentStore()
+
+
+class FollowRequestStore:
+    """follow requests by id, with the pending ones indexed by (from, to) and by recipient,
+    and the approved ones by recipient"""
+
+    def __init__(self):
+        self._by_id: Dict[int, Dict] = {}
+        self._pending: Dict[Tuple[str, str], int] = {}
+        #to_user -> id request haye pending, be tartib resid
+        self._inbox: Dict[str, Dict[int, None]] = {}
+        #to_user -> id request haye approved, baraye amar follower ha
+        self._approved: Dict[str, Dict[int, None]] = {}
+        self._last_id = 0
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def last_id(self) -> int:
+        return self._last_id
+
+    def get(self, request_id: int) -> Optional[Dict]:
+        return self._by_id.get(request_id)
+
+    def pending(self, from_user: str, to_user: str) -> Optional[Dict]:
+        request_id = self._pending.get((from_user, to_user))
+        return None if request_id is None else self._by_id[request_id]
+
+    def inbox(self, to_user: str) -> List[Dict]:
+        """pending requests to to_user, oldest first"""
+        return [self._by_id[request_id] for request_id in self._inbox.get(to_user, ())]
+
+    def inbox_count(self, to_user: str) -> int:
+        return len(self._inbox.get(to_user, ()))
+
+    def approved(self, to_user: str) -> List[Dict]:
+        """approved requests to to_user, oldest first"""
+        return [self._by_id[request_id] for request_id in self._approved.get(to_user, ())]
+
+    def add(self, request: Dict) -> bool:
+        """insert or update a request; False if nothing changed"""
+        old = self._by_id.get(request["id"])
+        if old == request:
+            return False
+        if old is not None:
+            self._unindex(old)
+        self._by_id[request["id"]] = request
+        self._last_id = max(self._last_id, request["id"])
+        if request["status"] == "pending":
+            self._pending[(request["from_user"], request["to_user"])] = request["id"]
+            self._inbox.setdefault(request["to_user"], {})[request["id"]] = None
+        elif request["status"] == "approved":
+            self._approved.setdefault(request["to_user"], {})[request["id"]] = None
+        return True
+
+    def _unindex(self, request: Dict):
+        if self._pending.get((request["from_user"], request["to_user"])) == request["id"]:
+            del self._pending[(request["from_user"], request["to_user"])]
+        self._inbox.get(request["to_user"], {}).pop(request["id"], None)
+        self._approved.get(request["to_user"], {}).pop(request["id"], None)
+
+    def resolve(self, request_id: int, status: str) -> Dict:
+        """mark a pending request approved/rejected and return the updated request"""
+        request = dict(self._by_id[request_id], status=status)
+        self.add(request)
+        return request
+
+    @classmethod
+    def load(cls, path: str) -> 'FollowRequestStore':
+        store = cls()
+        if not os.path.exists(path):
+            return store
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for request in json.load(f):
+                    store.add(request)
+        except Exception as e:
+            console.print(f"[red]error in loading follow requests {e}[/]")
+        return store
+
+    def save(self, path: str) -> bool:
+        try:
+            write_json_file(path, list(self))
+            return True
+        except Exception as e:
+            console.print(f"[red]error in saving follow requests {e}[/]")
+            return False
+
+follow_requests: FollowRequestStore = FollowRequestStore()
+
+
+class Storage:
+    """base class of the persistence backends"""
+    #True yani query ha az roye disk javab midan, na az object haye to hafeze
+    QUERIES_READ_DISK = False
+
+    def load(self):
+        raise NotImplementedError
+
+    def save_all(self):
+        raise NotImplementedError
+
+    def flush(self, records: List[List]):
+        """persist the records collected by the unit of work, see UnitOfWork.collect"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    #query haye pishfarz roye list haye to hafeze kar mikonan
+    #az User.posts estefade mikonim ke post ha bedoone decode kardan peyda beshan
+    def feed_post_ids(self, username: str, limit: Optional[int] = None) -> List[int]:
+        """ids of posts by the accounts username follows, oldest first; only the newest limit if given"""
+        if limit is None:
+            return sorted(post_id for followed in users[username].following for post_id in users[followed].posts)
+        #User.posts be tartib sakht hast pas faghat limit ta akhar har nafar lazeme
+        newest = heapq.nlargest(limit, (post_id for followed in users[username].following
+                                        for post_id in users[followed].posts[-limit:]))
+        return newest[::-1]
+
+    def user_post_ids(self, username: str, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+        """ids of username's posts newest first, skipping the offset newest ones"""
+        own = users[username].posts
+        end = len(own) - offset
+        start = 0 if limit is None else max(0, end - limit)
+        return own[start:max(0, end)][::-1]
+
+    def search_usernames(self, query: str, current_user: str, limit: Optional[int] = None) -> List[str]:
+        #hame backend ha user ha ro to hafeze daran, pas az index to hafeze javab midim
+        return search_ranked(query, current_user, SEARCH_LIMIT if limit is None else limit)
+
+
+class JsonStorage(Storage):
+    """users.json/posts.json snapshots plus an append-only journal"""
+
+    def load(self):
+        global users, posts, comments, follow_requests
+
+        loaded = None
+        if os.path.exists(SNAPSHOT_FILE):
+            try:
+                loaded = read_binary_snapshot(SNAPSHOT_FILE)
+            except Exception as e:
+                console.print(f"[red]error in loading binary snapshot, falling back to json {e}[/]")
+        if loaded is None:
+            loaded = read_json_snapshot()
+        posts.close()
+        users, posts = loaded
+        comments = CommentStore.load(COMMENTS_FILE)
+        follow_requests = FollowRequestStore.load(FOLLOW_REQUESTS_FILE)
+        self.replay_journal()
+
+    def save_all(self):
+        """write a full snapshot of users and posts and empty the journal"""
+        if os.path.exists(SNAPSHOT_FILE):
+            ok = write_binary_snapshot(SNAPSHOT_FILE)
+        else:
+            ok = write_json_snapshot()
+        ok = follow_requests.save(FOLLOW_REQUESTS_FILE) and ok
+
+        #journal faghat vaghti khali mishe ke snapshot kamel neveshte shode bashe
+        if ok and os.path.exists(JOURNAL_FILE):
+            try:
+                open(JOURNAL_FILE, "w").close()
+            except Exception as e:
+                console.print(f"[red]error in clearing journal {e}[/]")
+
+    def flush(self, records: List[List]):
+        new_comments = [record[1] for record in records if record[0] == "comment"]
+        if new_comments:
+            CommentStore.append_to_file(COMMENTS_FILE, new_comments)
+            records = [record for record in records if record[0] != "comment"]
+        if not records:
+            return
+        if not USE_JOURNAL:
+            self.save_all()
+            return
+
+        lines = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records)
+        try:
+            with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+                f.write(lines)
+                size = f.tell()
+        except Exception as e:
+            console.print(f"[red]error in writing journal {e}[/]")
+            return
+
+        if size > JOURNAL_COMPACT_SIZE:
+            self.compact()
+
+    def compact(self):
+        #journal ro to snapshot jadid jam mikonim
+        self.save_all()
+
+    def replay_journal(self):
+        if not os.path.exists(JOURNAL_FILE):
+            return
+
+        try:
+            with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except Exception as e:
+            console.print(f"[red]error in loading journal {e}[/]")
+            return
+
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                #khat akhar momkene nime kare neveshte shode bashe (crash)
+                console.print(f"[yellow]skipping broken journal record at line {line_number}[/]")
+                continue
+            try:
+                apply_record(record)
+            except Exception as e:
+                console.print(f"[red]error in replaying journal line {line_number}: {e}[/]")
+
+
+def read_json_snapshot() -> Tuple[Dict[str, 'User'], PostStore]:
+    loaded_users = {}
+    loaded_posts = []
     try:
         if os.path.exists(USERS_FILE):
             with open(USERS_FILE, "r", encoding="utf-8") as f:
                 users_data = json.load(f)
-                users = {username: User.from_dict(data) for username, data in users_data.items()}
+                loaded_users = {username: User.from_dict(data) for username, data in users_data.items()}
     except Exception as e:
         console.print(f"[red]error in loading users! {e}[/]")
 
-    try:
-        if os.path.exists(POSTS_FILE):
-            with open(POSTS_FILE, "r", encoding="utf-8") as f:
-                posts_data = json.load(f)
-                posts = [Post.from_dict(data) for data in posts_data]
-    except Exception as e:
-        console.print(f"[red]error in uploading post {e}[/]")
+    try:
+        if os.path.exists(POSTS_FILE):
+            with open(POSTS_FILE, "r", encoding="utf-8") as f:
+                posts_data = json.load(f)
+                loaded_posts = [Post.from_dict(data) for data in posts_data]
+    except Exception as e:
+        console.print(f"[red]error in uploading post {e}[/]")
+    return loaded_users, PostStore.from_posts(loaded_posts)
+
+def write_json_snapshot() -> bool:
+    ok = True
+    try:
+        #ba write-behind in az thread dige ham seda zade mishe, pas az copy dict estefade mikonim
+        users_data = {username: user.to_dict() for username, user in list(users.items())}
+        write_json_file(USERS_FILE, users_data)
+    except Exception as e:
+        ok = False
+        console.print(f"[red]error in saving users {e}[/]")
+
+    try:
+        posts_data = [post.to_dict() for post in posts]
+        write_json_file(POSTS_FILE, posts_data)
+    except Exception as e:
+        ok = False
+        console.print(f"[red]error in saving posts {e}[/]")
+    return ok
+
+
+#binary snapshot:
+#  magic | string table | users
+#har string (username, email, ...) faghat yek bar to jadval miyad va
+#baghiye ja ha shomare (u32) oon ro negah midaran. id post/comment ha u64 hastan.
+#hame adad ha little-endian hastan. post ha to posts.dat/posts.idx hastan (PostStore).
+SNAPSHOT_MAGIC = b"IGSNAP02"
+_U32 = "I" if array("I").itemsize == 4 else "L"
+
+def _pack_array(out: bytearray, typecode: str, values):
+    items = array(typecode, values)
+    if sys.byteorder == "big":
+        items.byteswap()
+    out += struct.pack("<I", len(items))
+    out += items.tobytes()
+
+def _unpack_array(buf: memoryview, offset: int, typecode: str) -> Tuple[array, int]:
+    (count,) = struct.unpack_from("<I", buf, offset)
+    offset += 4
+    items = array(typecode)
+    end = offset + count * items.itemsize
+    items.frombytes(buf[offset:end])
+    if sys.byteorder == "big":
+        items.byteswap()
+    return items, end
+
+def write_binary_snapshot(path: str) -> bool:
+    string_ids: Dict[str, int] = {}
+
+    def sid(value: str) -> int:
+        index = string_ids.get(value)
+        if index is None:
+            index = string_ids[value] = len(string_ids)
+        return index
+
+    try:
+        body = bytearray()
+        snapshot_users = list(users.values())
+        body += struct.pack("<I", len(snapshot_users))
+        for user in snapshot_users:
+            body += struct.pack("<5IB", sid(user.username), sid(user.email), sid(user.password),
+                                sid(user.bio), sid(to_iso(user.created_at)), user.is_private)
+            _pack_array(body, _U32, [sid(name) for name in user.followers])
+            _pack_array(body, _U32, [sid(name) for name in user.following])
+            _pack_array(body, _U32, [sid(name) for name in user.blocked_users])
+            _pack_array(body, "Q", user.posts)
+            _pack_array(body, "Q", user.saved_posts)
+
+        posts.rewrite(POSTS_DATA_FILE, POSTS_INDEX_FILE)
+
+        table = bytearray(SNAPSHOT_MAGIC)
+        table += struct.pack("<I", len(string_ids))
+        for value in string_ids:
+            encoded = value.encode("utf-8")
+            table += struct.pack("<I", len(encoded))
+            table += encoded
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(table)
+            f.write(body)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        console.print(f"[red]error in saving binary snapshot {e}[/]")
+        return False
+
+def read_binary_snapshot(path: str) -> Tuple[Dict[str, 'User'], PostStore]:
+    with open(path, "rb") as f:
+        buf = memoryview(f.read())
+    magic = bytes(buf[:len(SNAPSHOT_MAGIC)])
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not an instagram snapshot")
+    offset = len(SNAPSHOT_MAGIC)
+
+    (count,) = struct.unpack_from("<I", buf, offset)
+    offset += 4
+    strings = []
+    for _ in range(count):
+        (length,) = struct.unpack_from("<I", buf, offset)
+        offset += 4
+        strings.append(str(buf[offset:offset + length], "utf-8"))
+        offset += length
+
+    user_header = struct.Struct("<5IB")
+    loaded_users = {}
+    (count,) = struct.unpack_from("<I", buf, offset)
+    offset += 4
+    for _ in range(count):
+        username, email, password, bio, created_at, is_private = user_header.unpack_from(buf, offset)
+        offset += user_header.size
+        followers, offset = _unpack_array(buf, offset, _U32)
+        following, offset = _unpack_array(buf, offset, _U32)
+        blocked, offset = _unpack_array(buf, offset, _U32)
+        user_posts, offset = _unpack_array(buf, offset, "Q")
+        saved, offset = _unpack_array(buf, offset, "Q")
+        loaded_users[strings[username]] = User.restore({
+            "username": strings[username],
+            "email": strings[email],
+            "password": strings[password],
+            "bio": strings[bio],
+            "followers": [strings[i] for i in followers],
+            "following": [strings[i] for i in following],
+            "posts": user_posts.tolist(),
+            "saved_posts": saved.tolist(),
+            "blocked_users": [strings[i] for i in blocked],
+            "is_private": bool(is_private),
+            "created_at": strings[created_at],
+        })
+
+    if not os.path.exists(POSTS_INDEX_FILE):
+        return loaded_users, PostStore()
+    return loaded_users, PostStore.open(POSTS_DATA_FILE, POSTS_INDEX_FILE)
+
+def convert_snapshot(target: str):
+    """convert the data directory snapshot between "json" and "binary" """
+    global users, posts
+    unit_of_work.paused = True
+    graph.clear()
+    try:
+        if target == "binary":
+            users, posts = read_json_snapshot()
+            if write_binary_snapshot(SNAPSHOT_FILE):
+                console.print(f"[green]wrote {SNAPSHOT_FILE} and {POSTS_DATA_FILE}[/]")
+        elif target == "json":
+            users, posts = read_binary_snapshot(SNAPSHOT_FILE)
+            if write_json_snapshot():
+                #json ro be onvan snapshot asli negah midarim
+                posts.close()
+                for path in (SNAPSHOT_FILE, POSTS_DATA_FILE, POSTS_INDEX_FILE):
+                    if os.path.exists(path):
+                        os.remove(path)
+                console.print(f"[green]wrote {USERS_FILE} and {POSTS_FILE}[/]")
+        else:
+            console.print(f"[red]unknown snapshot format {target!r}, use json or binary[/]")
+    finally:
+        unit_of_work.paused = False
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    password TEXT NOT NULL,
+    bio TEXT NOT NULL DEFAULT '',
+    is_private INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_username_nocase ON users (username COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    author TEXT NOT NULL,
+    caption TEXT NOT NULL,
+    image_path TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_author ON posts (author, id);
+CREATE TABLE IF NOT EXISTS likes (
+    post_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (post_id, username)
+);
+CREATE INDEX IF NOT EXISTS likes_username ON likes (username);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_post ON comments (post_id, id);
+CREATE TABLE IF NOT EXISTS follows (
+    follower TEXT NOT NULL,
+    followee TEXT NOT NULL,
+    PRIMARY KEY (follower, followee)
+);
+CREATE INDEX IF NOT EXISTS follows_followee ON follows (followee);
+CREATE TABLE IF NOT EXISTS blocks (
+    blocker TEXT NOT NULL,
+    blocked TEXT NOT NULL,
+    PRIMARY KEY (blocker, blocked)
+);
+CREATE TABLE IF NOT EXISTS saved_posts (
+    username TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    PRIMARY KEY (username, post_id)
+);
+CREATE TABLE IF NOT EXISTS follow_requests (
+    id INTEGER PRIMARY KEY,
+    from_user TEXT NOT NULL,
+    to_user TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (from_user, to_user)
+);
+CREATE INDEX IF NOT EXISTS follow_requests_to_user ON follow_requests (to_user, status);
+"""
+
+
+class SqliteStorage(Storage):
+    """indexed tables in one sqlite file, every write touches only its own rows"""
+    QUERIES_READ_DISK = True
+
+    def __init__(self, path: str = SQLITE_FILE):
+        self.path = path
+        #write-behind az thread khodesh roye hamin connection minevise
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SQLITE_SCHEMA)
+
+    def load(self):
+        global users, posts, comments, follow_requests
+
+        #avalin bar ke sqlite roshan mishe data ye json ro montaghel mikonim
+        has_json_data = os.path.exists(USERS_FILE) or os.path.exists(JOURNAL_FILE)
+        if self.db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0 and has_json_data:
+            JsonStorage().load()
+            self.save_all()
+            return
+
+        db = self.db
+        users = {}
+        for username, email, password, bio, is_private, created_at in db.execute(
+                "SELECT username, email, password, bio, is_private, created_at FROM users ORDER BY rowid"):
+            user = User(username, email, password)
+            user.bio = bio
+            user.is_private = bool(is_private)
+            user.created_at = created_at
+            users[username] = user
+
+        for follower, followee in db.execute("SELECT follower, followee FROM follows ORDER BY rowid"):
+            graph.follow(follower, followee)
+        for blocker, blocked in db.execute("SELECT blocker, blocked FROM blocks ORDER BY rowid"):
+            graph.block(blocker, blocked)
+        for username, post_id in db.execute("SELECT username, post_id FROM saved_posts ORDER BY rowid"):
+            users[username].saved_posts.append(post_id)
+
+        posts.close()
+        posts = PostStore()
+        for post_id, author, caption, image_path, created_at in db.execute(
+                "SELECT id, author, caption, image_path, created_at FROM posts ORDER BY id"):
+            post = Post.restore({"id": post_id, "author": author, "caption": caption, "image_path": image_path,
+                                 "likes": [], "comments": [], "created_at": created_at})
+            posts.add(post)
+            users[author].posts.append(post_id)
+        for post_id, username in db.execute("SELECT post_id, username FROM likes ORDER BY rowid"):
+            posts[post_id].likes.add(username)
+
+        comments = CommentStore()
+        for comment_id, post_id, author, text, created_at in db.execute(
+                "SELECT id, post_id, author, text, created_at FROM comments ORDER BY id"):
+            comments.add({"id": comment_id, "post_id": post_id, "author": author, "text": text, "created_at": created_at})
+            if post_id in posts:
+                posts[post_id].comments.append(comment_id)
+
+        follow_requests = FollowRequestStore()
+        for request_id, from_user, to_user, status, created_at in db.execute(
+                "SELECT id, from_user, to_user, status, created_at FROM follow_requests ORDER BY id"):
+            follow_requests.add({"id": request_id, "from_user": from_user, "to_user": to_user,
+                                 "status": status, "created_at": created_at})
+
+    def save_all(self):
+        try:
+            with self.db:
+                for table in ("users", "posts", "likes", "comments", "follows", "blocks", "saved_posts", "follow_requests"):
+                    self.db.execute(f"DELETE FROM {table}")
+                for user in users.values():
+                    self._insert_user(user.to_dict())
+                for post in posts:
+                    self._insert_post(post.to_dict())
+                for comment in comments:
+                    self._insert_comment(comment)
+                for request in follow_requests:
+                    self._insert_follow_request(request)
+        except Exception as e:
+            console.print(f"[red]error in saving database {e}[/]")
+
+    def flush(self, records: List[List]):
+        try:
+            with self.db:
+                for record in records:
+                    getattr(self, "_flush_" + record[0])(*record[1:])
+        except Exception as e:
+            console.print(f"[red]error in saving changes to database {e}[/]")
+
+    def close(self):
+        self.db.close()
+
+    def feed_post_ids(self, username: str, limit: Optional[int] = None) -> List[int]:
+        rows = self.db.execute(
+            "SELECT p.id FROM follows f JOIN posts p ON p.author = f.followee "
+            "WHERE f.follower = ? ORDER BY p.id DESC LIMIT ?", (username, -1 if limit is None else limit))
+        return [post_id for (post_id,) in rows][::-1]
+
+    def user_post_ids(self, username: str, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+        rows = self.db.execute("SELECT id FROM posts WHERE author = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                               (username, -1 if limit is None else limit, offset))
+        return [post_id for (post_id,) in rows]
+
+    def _insert_user(self, data: Dict):
+        self.db.execute(
+            "INSERT OR REPLACE INTO users (username, email, password, bio, is_private, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (data["username"], data["email"], data["password"], data["bio"], int(data["is_private"]), data["created_at"]))
+        self.db.executemany("INSERT OR IGNORE INTO follows (follower, followee) VALUES (?, ?)",
+                            [(data["username"], other) for other in data["following"]])
+        self.db.executemany("INSERT OR IGNORE INTO blocks (blocker, blocked) VALUES (?, ?)",
+                            [(data["username"], other) for other in data["blocked_users"]])
+        self.db.executemany("INSERT OR IGNORE INTO saved_posts (username, post_id) VALUES (?, ?)",
+                            [(data["username"], post_id) for post_id in data["saved_posts"]])
+
+    def _insert_post(self, data: Dict):
+        self.db.execute(
+            "INSERT OR REPLACE INTO posts (id, author, caption, image_path, created_at) VALUES (?, ?, ?, ?, ?)",
+            (data["id"], data["author"], data["caption"], data["image_path"], data["created_at"]))
+        self.db.executemany("INSERT OR IGNORE INTO likes (post_id, username) VALUES (?, ?)",
+                            [(data["id"], username) for username in data["likes"]])
+
+    def _insert_comment(self, comment: Dict):
+        self.db.execute(
+            "INSERT OR REPLACE INTO comments (id, post_id, author, text, created_at) VALUES (?, ?, ?, ?, ?)",
+            (comment["id"], comment["post_id"], comment["author"], comment["text"], comment["created_at"]))
+
+    def _insert_follow_request(self, request: Dict):
+        self.db.execute(
+            "INSERT OR REPLACE INTO follow_requests (id, from_user, to_user, status, created_at) VALUES (?, ?, ?, ?, ?)",
+            (request["id"], request["from_user"], request["to_user"], request["status"], request["created_at"]))
+
+    #list haye User/Post ke to sqlite jadval joda daran: field -> (table, owner column, item column)
+    #User.posts va Post.comments az jadval posts/comments sakhte mishan va inja nistan
+    USER_RELATIONS = {
+        "following": ("follows", "follower", "followee"),
+        "followers": ("follows", "followee", "follower"),
+        "blocked_users": ("blocks", "blocker", "blocked"),
+        "saved_posts": ("saved_posts", "username", "post_id"),
+    }
+    POST_RELATIONS = {
+        "likes": ("likes", "post_id", "username"),
+    }
+
+    def _flush_entity(self, table: str, key_column: str, columns: Tuple[str, ...], relations: Dict,
+                      key, fields: Dict, deltas: List):
+        row = {column: fields[column] for column in columns if column in fields}
+        if len(row) == len(columns):
+            #entity jadid, kol satr ro minevisim
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                tuple(row.values()))
+        elif row:
+            assignments = ", ".join(f"{column} = ?" for column in row)
+            self.db.execute(f"UPDATE {table} SET {assignments} WHERE {key_column} = ?", (*row.values(), key))
+
+        for field, (relation, owner_column, item_column) in relations.items():
+            if field in fields:
+                self.db.execute(f"DELETE FROM {relation} WHERE {owner_column} = ?", (key,))
+                self.db.executemany(
+                    f"INSERT OR IGNORE INTO {relation} ({owner_column}, {item_column}) VALUES (?, ?)",
+                    [(key, item) for item in fields[field]])
+        for field, op, item in deltas:
+            if field not in relations:
+                continue
+            relation, owner_column, item_column = relations[field]
+            if op == "+":
+                self.db.execute(f"INSERT OR IGNORE INTO {relation} ({owner_column}, {item_column}) VALUES (?, ?)", (key, item))
+            else:
+                self.db.execute(f"DELETE FROM {relation} WHERE {owner_column} = ? AND {item_column} = ?", (key, item))
+
+    def _flush_user(self, username: str, fields: Dict, deltas: List):
+        if "is_private" in fields:
+            fields = dict(fields, is_private=int(fields["is_private"]))
+        self._flush_entity("users", "username", ("username", "email", "password", "bio", "is_private", "created_at"),
+                           self.USER_RELATIONS, username, fields, deltas)
+
+    def _flush_post(self, post_id: int, fields: Dict, deltas: List):
+        self._flush_entity("posts", "id", ("id", "author", "caption", "image_path", "created_at"),
+                           self.POST_RELATIONS, post_id, fields, deltas)
+
+    def _flush_comment(self, comment: Dict):
+        self._insert_comment(comment)
+
+    def _flush_follow_request(self, request: Dict):
+        self._insert_follow_request(request)
+
+
+def coalesce_records(records: List[List]) -> List[List]:
+    """merge the records of each entity into one, keeping only the last +/- per item"""
+    merged: Dict[Tuple, List] = {}
+    for record in records:
+        if record[0] not in ("user", "post"):
+            merged[(len(merged),)] = record
+            continue
+        kind, key, fields, deltas = record
+        entry = merged.get((kind, key))
+        if entry is None:
+            entry = merged[(kind, key)] = [kind, key, {}, {}]
+        for field, value in fields.items():
+            entry[2][field] = value
+            for delta_key in [k for k in entry[3] if k[0] == field]:
+                del entry[3][delta_key]
+        for field, op, item in deltas:
+            if field in entry[2]:
+                #field kamel ghablan to record hast, delta ro mostaghim roye oon emal mikonim
+                value = entry[2][field] = list(entry[2][field])
+                if op == "+" and item not in value:
+                    value.append(item)
+                elif op == "-" and item in value:
+                    value.remove(item)
+            else:
+                entry[3].pop((field, item), None)
+                entry[3][(field, item)] = op
+
+    result = []
+    for entry in merged.values():
+        if entry[0] in ("user", "post"):
+            kind, key, fields, deltas = entry
+            entry = [kind, key, fields, [[field, op, item] for (field, item), op in deltas.items()]]
+        result.append(entry)
+    return result
+
+
+class WriteBehindStorage(Storage):
+    """wraps another backend; flush() only queues, a background thread writes in batches"""
+
+    def __init__(self, inner: Storage, interval_ms: int = WRITE_BEHIND_INTERVAL_MS, max_ops: int = WRITE_BEHIND_MAX_OPS):
+        self.inner = inner
+        self.interval = interval_ms / 1000
+        self.max_ops = max_ops
+        self.pending: List[List] = []
+        self.lock = threading.RLock()
+        self.wakeup = threading.Condition(threading.Lock())
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.thread.start()
+
+    def flush(self, records: List[List]):
+        with self.wakeup:
+            was_empty = not self.pending
+            self.pending.extend(records)
+            #avvalin record saat interval ro rah mindaze; max_ops ham zoodtar mifreste
+            if was_empty or len(self.pending) >= self.max_ops:
+                self.wakeup.notify()
+
+    def sync(self):
+        """write everything that is still queued, on the calling thread"""
+        #lock ghabl az bardashtan saf, ke do ta sync hamzaman batch ha ro bar aks nanevisan
+        with self.lock:
+            with self.wakeup:
+                records, self.pending = self.pending, []
+            if records:
+                self.inner.flush(coalesce_records(records))
+
+    def _run(self):
+        while True:
+            with self.wakeup:
+                if not self.pending and not self.stopped:
+                    self.wakeup.wait()
+                if self.stopped:
+                    return
+                #ta max_ops ya interval sabr mikonim ke taghirat bishtari yekja beran
+                deadline = time.monotonic() + self.interval
+                while len(self.pending) < self.max_ops and not self.stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.wakeup.wait(remaining)
+            self.sync()
+
+    def close(self):
+        with self.wakeup:
+            self.stopped = True
+            self.wakeup.notify()
+        self.thread.join()
+        self.sync()
+        self.inner.close()
+
+    def load(self):
+        with self.lock:
+            self.inner.load()
+
+    def save_all(self):
+        self.sync()
+        with self.lock:
+            self.inner.save_all()
+
+    def _query(self, method: str, *args):
+        #age backend az disk javab mide aval saf ro khali mikonim
+        if self.inner.QUERIES_READ_DISK:
+            self.sync()
+        with self.lock:
+            return getattr(self.inner, method)(*args)
+
+    def feed_post_ids(self, username: str, limit: Optional[int] = None) -> List[int]:
+        return self._query("feed_post_ids", username, limit)
+
+    def user_post_ids(self, username: str, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+        return self._query("user_post_ids", username, offset, limit)
+
+    def search_usernames(self, query: str, current_user: str, limit: Optional[int] = None) -> List[str]:
+        #search az index to hafeze hast, sync lazem nist
+        return self.inner.search_usernames(query, current_user, limit)
+
+
+STORAGE_BACKENDS = {
+    "json": JsonStorage,
+    "sqlite": SqliteStorage,
+}
+
+storage: Storage = JsonStorage()
+
+def open_storage(backend: str = STORAGE_BACKEND, write_behind: bool = WRITE_BEHIND) -> Storage:
+    global storage
+    if backend not in STORAGE_BACKENDS:
+        console.print(f"[red]unknown storage backend {backend!r}, using json[/]")
+        backend = "json"
+    storage.close()
+    storage = STORAGE_BACKENDS[backend]()
+    if write_behind:
+        storage = WriteBehindStorage(storage)
+    return storage
+
+def load_data():
+    #object hayi ke az disk miyan dirty hesab nemishan
+    unit_of_work.paused = True
+    graph.clear()
+    timelines.clear()
+    visibility.clear()
+    try:
+        storage.load()
+        #User.posts index post haye har nafar be tartib id hast; data ghadimi shayad morattab nabashe
+        for user in users.values():
+            own = user.posts
+            if any(own[i] > own[i + 1] for i in range(len(own) - 1)):
+                own.sort()
+        username_index.rebuild(users)
+        #id haye jadid bayad az hame id haye roye disk bozorgtar bashan, hata age saat ye node jolo bood
+        id_generator.observe(max(posts.last_id(), comments.last_id(), follow_requests.last_id()))
+    finally:
+        unit_of_work.paused = False
+        unit_of_work.reset()
+
+def save_data():
+    storage.save_all()
+
+def commit():
+    """flush everything the unit of work collected since the last commit"""
+    records = unit_of_work.collect()
+    if records:
+        storage.flush(records)
+
+def write_json_file(path: str, data):
+    #aval to file movaghat minevisim ke age vasatesh crash shod snapshot kharab nashe
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+#apply_record bayad idempotent bashe chon age bad az snapshot va ghabl az
+#khali kardan journal crash beshe ye record momkene do bar ejra beshe
+def _apply_fields(entity: 'Entity', fields: Dict, deltas: List):
+    for field, value in fields.items():
+        setattr(entity, field, value)
+    for field, op, item in deltas:
+        entity.apply_delta(field, op, item)
+
+def _apply_user(username: str, fields: Dict, deltas: List):
+    if username in users:
+        _apply_fields(users[username], fields, deltas)
+    elif "email" in fields:
+        users[username] = User.from_dict(fields)
+        _apply_fields(users[username], {}, deltas)
+    else:
+        console.print(f"[yellow]journal changes unknown user {username}[/]")
+
+def _apply_post(post_id: int, fields: Dict, deltas: List):
+    post = posts.get(post_id)
+    if post is not None:
+        _apply_fields(post, fields, deltas)
+        posts.pin(post)
+    elif "author" in fields:
+        post = Post.from_dict(fields)
+        _apply_fields(post, {}, deltas)
+        posts.add(post)
+    else:
+        console.print(f"[yellow]journal changes unknown post {post_id}[/]")
+
+def _apply_follow_request(request: Dict):
+    #request ye bar ba "pending" va baad ba status nahayi miyad; akhari barande ast
+    follow_requests.add(request)
+
+RECORD_APPLIERS = {
+    "user": _apply_user,
+    "post": _apply_post,
+    "follow_request": _apply_follow_request,
+}
+
+def apply_record(record: List):
+    kind, *args = record
+    if kind not in RECORD_APPLIERS:
+        console.print(f"[yellow]unknown journal record {kind!r}[/]")
+        return
+    RECORD_APPLIERS[kind](*args)
+
+
+class UnitOfWork:
+    """collects dirty users/posts and new comments/requests until commit()"""
+
+    def __init__(self):
+        self.paused = False
+        self.dirty: Dict[Tuple[str, object], 'Entity'] = {}
+        self.new_records: List[List] = []
+
+    def register(self, entity: 'Entity'):
+        self.dirty[(entity.KIND, entity.key())] = entity
+        if entity.KIND == "post":
+            #post taghir karde nabayad az cache PostStore biroon bere
+            posts.pin(entity)
+
+    def add_comment(self, comment: Dict):
+        self.new_records.append(["comment", comment])
+
+    def add_follow_request(self, request: Dict):
+        self.new_records.append(["follow_request", request])
+
+    def reset(self):
+        for entity in self.dirty.values():
+            entity.pop_changes()
+        self.dirty.clear()
+        self.new_records.clear()
+
+    def collect(self) -> List[List]:
+        """one [kind, key, fields, deltas] record per dirty entity, then the new rows"""
+        records = []
+        for entity in self.dirty.values():
+            changes = entity.pop_changes()
+            fields = {}
+            deltas = []
+            for field, ops in changes.items():
+                if ops is None:
+                    value = getattr(entity, field)
+                    if field in entity.TIME_FIELDS:
+                        value = to_iso(value)
+                    #list ha va view haye graph be list sade tabdil mishan
+                    fields[field] = value if isinstance(value, (str, int, float, bool, type(None))) else list(value)
+                else:
+                    deltas.extend([field, op, item] for op, item in ops)
+            records.append([entity.KIND, entity.key(), fields, deltas])
+        records.extend(self.new_records)
+        self.dirty.clear()
+        self.new_records = []
+        return records
+
+unit_of_work = UnitOfWork()
+
+
+class TrackedList(list):
+    """list that reports appends/removes to its owner, so only the change is flushed"""
+    __slots__ = ("_owner", "_field")
+
+    def __init__(self, owner: 'Entity', field: str, items=()):
+        super().__init__(items)
+        self._owner = owner
+        self._field = field
+
+    def append(self, item):
+        super().append(item)
+        self._owner.note_delta(self._field, "+", item)
+
+    def remove(self, item):
+        super().remove(item)
+        self._owner.note_delta(self._field, "-", item)
+
+    #baghiye taghirat kol list ro dirty mikonan
+    def _rewritten(name):
+        def method(self, *args, **kwargs):
+            result = getattr(list, name)(self, *args, **kwargs)
+            self._owner.mark_dirty(self._field)
+            return self if name == "__iadd__" else result
+        return method
+
+    extend = _rewritten("extend")
+    insert = _rewritten("insert")
+    pop = _rewritten("pop")
+    clear = _rewritten("clear")
+    sort = _rewritten("sort")
+    reverse = _rewritten("reverse")
+    __setitem__ = _rewritten("__setitem__")
+    __delitem__ = _rewritten("__delitem__")
+    __iadd__ = _rewritten("__iadd__")
+    del _rewritten
+
+
+class TrackedSet:
+    """insertion-ordered set that reports adds/discards to its owner; membership and size are O(1)"""
+    __slots__ = ("_items", "_owner", "_field")
+
+    def __init__(self, owner: 'Entity', field: str, items=()):
+        self._items: Dict = dict.fromkeys(items)
+        self._owner = owner
+        self._field = field
+
+    def __contains__(self, item) -> bool:
+        return item in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+    def add(self, item) -> bool:
+        #faghat age vaghan ezafe beshe delta sabt mishe
+        if item in self._items:
+            return False
+        self._items[item] = None
+        self._owner.note_delta(self._field, "+", item)
+        return True
+
+    def discard(self, item) -> bool:
+        if item not in self._items:
+            return False
+        del self._items[item]
+        self._owner.note_delta(self._field, "-", item)
+        return True
+
+
+class IdGenerator:
+    """snowflake style 64-bit ids that sort by creation time"""
+    NODE_BITS = 10
+    SEQUENCE_BITS = 12
+
+    def __init__(self, node: Optional[int] = ID_NODE):
+        #None yani moghe avalin id ye node ejare mishe (data dir bayad oon moghe sakhte shode bashe)
+        self.node = None if node is None else node & ((1 << self.NODE_BITS) - 1)
+        self._lease = None
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _lease_node(self) -> int:
+        """a node no other running process on this data dir holds: a flock on NODES_DIR/<node>.lock,
+        which the OS releases when the process exits"""
+        nodes = 1 << self.NODE_BITS
+        if fcntl is None:
+            console.print("[yellow]can't lock a node id here; set INSTAGRAM_NODE_ID if several processes share the data directory[/]")
+            return os.getpid() % nodes
+        os.makedirs(NODES_DIR, exist_ok=True)
+        start = os.getpid() % nodes
+        for i in range(nodes):
+            node = (start + i) % nodes
+            lease = open(os.path.join(NODES_DIR, f"{node}.lock"), "a")
+            try:
+                fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lease.close()
+                continue
+            self._lease = lease
+            return node
+        raise RuntimeError(f"all {nodes} node ids in {NODES_DIR} are in use")
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self.node is None:
+                self.node = self._lease_node()
+            #age saat aghab bargasht, roye hamoon millisecond ghabli edame midim
+            now = max(int(time.time() * 1000) - ID_EPOCH_MS, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & ((1 << self.SEQUENCE_BITS) - 1)
+                if self._sequence == 0:
+                    #4096 ta id to ye millisecond tamoom shod, millisecond baadi ro gharz migirim
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (self.NODE_BITS + self.SEQUENCE_BITS)) | (self.node << self.SEQUENCE_BITS) | self._sequence
+
+    def observe(self, existing_id: int):
+        """make sure later ids are bigger than an id that already exists"""
+        with self._lock:
+            existing_ms = existing_id >> (self.NODE_BITS + self.SEQUENCE_BITS)
+            if existing_ms >= self._last_ms:
+                self._last_ms = existing_ms
+                self._sequence = (1 << self.SEQUENCE_BITS) - 1
+
+    @staticmethod
+    def created_ms(snowflake: int) -> int:
+        """unix milliseconds an id was made at"""
+        return (snowflake >> (IdGenerator.NODE_BITS + IdGenerator.SEQUENCE_BITS)) + ID_EPOCH_MS
+
+id_generator = IdGenerator()
+
+
+class UserIds:
+    """dense int id per username, handed out on first use; only lives in memory.
+    relations (graph, likes, comment authors) keep these ids, usernames are only for input/output"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+
+    def get(self, username: str) -> Optional[int]:
+        return self._ids.get(username)
+
+    def id_of(self, username: str) -> int:
+        user_id = self._ids.get(username)
+        if user_id is None:
+            username = sys.intern(username)
+            user_id = self._ids[username] = len(self._names)
+            self._names.append(username)
+        return user_id
+
+    def name_of(self, user_id: int) -> str:
+        return self._names[user_id]
+
+user_ids = UserIds()
+
+
+class IdSet:
+    """small sorted set of user ids in an array('I'); 4 bytes per id instead of a set slot"""
+    __slots__ = ("_ids",)
+
+    def __init__(self, values=()):
+        self._ids = array("I", sorted(set(values)))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, value: int) -> bool:
+        i = bisect.bisect_left(self._ids, value)
+        return i < len(self._ids) and self._ids[i] == value
+
+    def add(self, value: int) -> bool:
+        i = bisect.bisect_left(self._ids, value)
+        if i < len(self._ids) and self._ids[i] == value:
+            return False
+        self._ids.insert(i, value)
+        return True
+
+    def discard(self, value: int) -> bool:
+        i = bisect.bisect_left(self._ids, value)
+        if i < len(self._ids) and self._ids[i] == value:
+            del self._ids[i]
+            return True
+        return False
+
+    def __and__(self, other) -> List[int]:
+        #rooye koochik tar migardim, to bozorg tar binary search
+        small, big = (self, other) if len(self) <= len(other) else (other, self)
+        return [value for value in small if value in big]
+
+
+class IdBitmap:
+    """roaring-style set of ints: one container per high 16 bits,
+    a sorted array('H') while sparse and an 8KB bitset once dense"""
+
+    def __init__(self, values=()):
+        self._containers: Dict[int, object] = {}
+        self._counts: Dict[int, int] = {}
+        self._size = 0
+        for value in values:
+            self.add(value)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, value: int) -> bool:
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, bytearray):
+            return bool(container[low >> 3] >> (low & 7) & 1)
+        i = bisect.bisect_left(container, low)
+        return i < len(container) and container[i] == low
+
+    def add(self, value: int) -> bool:
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            container = self._containers[high] = array("H")
+        if isinstance(container, bytearray):
+            if container[low >> 3] >> (low & 7) & 1:
+                return False
+            container[low >> 3] |= 1 << (low & 7)
+        else:
+            i = bisect.bisect_left(container, low)
+            if i < len(container) and container[i] == low:
+                return False
+            container.insert(i, low)
+            if len(container) > BITMAP_ARRAY_MAX:
+                self._containers[high] = self._to_bitset(container)
+        self._counts[high] = self._counts.get(high, 0) + 1
+        self._size += 1
+        return True
+
+    def discard(self, value: int) -> bool:
+        if value not in self:
+            return False
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers[high]
+        count = self._counts[high] - 1
+        self._size -= 1
+        if count == 0:
+            del self._containers[high], self._counts[high]
+            return True
+        self._counts[high] = count
+        if isinstance(container, bytearray):
+            container[low >> 3] &= ~(1 << (low & 7))
+            #nesf-e hadaksar ke nazdik marz hey tabdil nashe
+            if count <= BITMAP_ARRAY_MAX // 2:
+                self._containers[high] = array("H", self._bits(container))
+        else:
+            container.pop(bisect.bisect_left(container, low))
+        return True
+
+    def __iter__(self):
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            base = high << 16
+            lows = self._bits(container) if isinstance(container, bytearray) else container
+            for low in lows:
+                yield base | low
+
+    def __and__(self, other) -> List[int]:
+        small, big = (self, other) if len(self) <= len(other) else (other, self)
+        return [value for value in small if value in big]
+
+    @staticmethod
+    def _to_bitset(values) -> bytearray:
+        bits = bytearray(8192)
+        for low in values:
+            bits[low >> 3] |= 1 << (low & 7)
+        return bits
+
+    @staticmethod
+    def _bits(bits: bytearray):
+        for byte_index, byte in enumerate(bits):
+            while byte:
+                low_bit = byte & -byte
+                yield byte_index << 3 | low_bit.bit_length() - 1
+                byte ^= low_bit
+
+
+class LikeSet(TrackedSet):
+    """likes of one post as user ids: an IdSet, or an IdBitmap once it passes LIKES_BITMAP_MIN"""
+    __slots__ = ()
+
+    def __init__(self, owner: 'Entity', field: str, items=()):
+        self._owner = owner
+        self._field = field
+        self._items = IdSet(user_ids.id_of(username) for username in items)
+        if 0 < LIKES_BITMAP_MIN <= len(self._items):
+            self._items = IdBitmap(self._items)
+
+    def __contains__(self, username) -> bool:
+        user_id = user_ids.get(username)
+        return user_id is not None and user_id in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return map(user_ids.name_of, self._items)
+
+    def ids(self):
+        return self._items
+
+    def add(self, username) -> bool:
+        user_id = user_ids.id_of(username)
+        if not self._items.add(user_id):
+            return False
+        if isinstance(self._items, IdSet) and 0 < LIKES_BITMAP_MIN <= len(self._items):
+            self._items = IdBitmap(self._items)
+        self._owner.note_delta(self._field, "+", username)
+        return True
+
+    def discard(self, username) -> bool:
+        user_id = user_ids.get(username)
+        if user_id is None or not self._items.discard(user_id):
+            return False
+        self._owner.note_delta(self._field, "-", username)
+        return True
+
+
+class Entity:
+    """base of User and Post; remembers which fields changed since the last flush"""
+    #__slots__: bedoone __dict__ har user/post kheili kamtar ja migire
+    __slots__ = ("_dirty",)
+    KIND = ""
+    FIELDS: Tuple[str, ...] = ()
+    #field haye esm karbar; sys.intern mishan ke hame ye string moshtarak dashte bashan
+    NAME_FIELDS: Tuple[str, ...] = ()
+    #field hayi ke be jaye list, set hastan (masalan likes) -> class-e set
+    SET_FIELDS: Dict[str, type] = {}
+    #zaman ha: ISO ke biyad be microsecond tabdil mishe
+    TIME_FIELDS: Tuple[str, ...] = ("created_at",)
+
+    def _track(self, name: str, value):
+        if name in self.NAME_FIELDS and isinstance(value, str):
+            return sys.intern(value)
+        if name in self.TIME_FIELDS and value is not None:
+            return to_epoch_us(value)
+        if name in self.SET_FIELDS:
+            return self.SET_FIELDS[name](self, name, value or ())
+        if isinstance(value, list):
+            return TrackedList(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        if name in self.FIELDS:
+            value = self._track(name, value)
+            object.__setattr__(self, name, value)
+            self.mark_dirty(name)
+        else:
+            object.__setattr__(self, name, value)
+
+    def key(self):
+        raise NotImplementedError
+
+    @classmethod
+    def restore(cls, values: Dict) -> 'Entity':
+        """build an entity straight from stored field values, without __init__"""
+        entity = cls.__new__(cls)
+        for field, value in values.items():
+            object.__setattr__(entity, field, entity._track(field, value))
+        return entity
+
+    def _changes(self) -> Dict[str, Optional[List]]:
+        #field -> None yani kol field avaz shode, list yani faghat in +/- ha
+        changes = getattr(self, "_dirty", None)
+        if changes is None:
+            changes = {}
+            object.__setattr__(self, "_dirty", changes)
+        return changes
+
+    def mark_dirty(self, field: str):
+        if unit_of_work.paused:
+            return
+        self._changes()[field] = None
+        unit_of_work.register(self)
+
+    def note_delta(self, field: str, op: str, item):
+        if unit_of_work.paused:
+            return
+        changes = self._changes()
+        if field in changes and changes[field] is None:
+            return
+        changes.setdefault(field, []).append((op, item))
+        unit_of_work.register(self)
+
+    def pop_changes(self) -> Dict[str, Optional[List]]:
+        changes = getattr(self, "_dirty", None) or {}
+        object.__setattr__(self, "_dirty", {})
+        return changes
+
+    def apply_delta(self, field: str, op: str, item):
+        #replay ye +/- az journal; bayad idempotent bashe
+        items = getattr(self, field)
+        if isinstance(items, TrackedSet):
+            items.add(item) if op == "+" else items.discard(item)
+        elif op == "+" and item not in items:
+            items.append(item)
+        elif op == "-" and item in items:
+            items.remove(item)
+
+
+class NameView:
+    """read-only view of a set of user ids that speaks usernames"""
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return map(user_ids.name_of, self._ids)
+
+    def __contains__(self, username) -> bool:
+        user_id = user_ids.get(username)
+        return user_id is not None and user_id in self._ids
+
+    def __repr__(self) -> str:
+        return f"NameView({list(self)!r})"
+
+    def ids(self):
+        return self._ids
+
+_NO_EDGES = IdSet()
+
+
+class IdSetAdjacency:
+    """user id -> IdSet of neighbour ids"""
+
+    def __init__(self):
+        self._rows: Dict[int, IdSet] = {}
+
+    def clear(self):
+        self._rows.clear()
+
+    def row(self, user_id: Optional[int]):
+        return _NO_EDGES if user_id is None else self._rows.get(user_id, _NO_EDGES)
+
+    def degree(self, user_id: Optional[int]) -> int:
+        return len(self.row(user_id))
+
+    def add(self, user_id: int, other_id: int) -> bool:
+        row = self._rows.get(user_id)
+        if row is None:
+            row = self._rows[user_id] = IdSet()
+        return row.add(other_id)
+
+    def discard(self, user_id: int, other_id: int) -> bool:
+        row = self._rows.get(user_id)
+        return row is not None and row.discard(other_id)
+
+    def two_hop(self, user_id: int) -> Counter:
+        """neighbours of neighbours, with how many paths reach each"""
+        counts = Counter()
+        for other_id in self.row(user_id):
+            counts.update(self.row(other_id))
+        return counts
+
+
+class CsrRow:
+    """one user's neighbours as a sorted numpy uint32 array"""
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids.tolist())
+
+    def __contains__(self, value: int) -> bool:
+        i = int(self._ids.searchsorted(value))
+        return i < len(self._ids) and self._ids[i] == value
+
+    def __and__(self, other) -> List[int]:
+        if isinstance(other, CsrRow):
+            return np.intersect1d(self._ids, other._ids, assume_unique=True).tolist()
+        #mesl IdSet: rooye koochik tar migardim (masalan following, na like haye ye post viral)
+        if len(self) <= len(other):
+            return [value for value in self._ids.tolist() if value in other]
+        return [value for value in other if value in self]
+
+    __rand__ = __and__
+
+
+class CsrAdjacency:
+    """neighbours of every user in CSR form (offsets + one sorted neighbour array),
+    plus small added/removed buffers that are merged in from time to time"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._targets = np.zeros(0, dtype=np.uint32)
+        self._added: Dict[int, IdSet] = {}
+        self._removed: Dict[int, IdSet] = {}
+        self._pending = 0
+
+    def _base(self, user_id: int):
+        if user_id >= len(self._offsets) - 1:
+            return self._targets[:0]
+        return self._targets[self._offsets[user_id]:self._offsets[user_id + 1]]
+
+    def _in_base(self, user_id: int, other_id: int) -> bool:
+        if user_id >= len(self._offsets) - 1:
+            return False
+        start, end = int(self._offsets[user_id]), int(self._offsets[user_id + 1])
+        if start == end:
+            return False
+        i = start + int(self._targets[start:end].searchsorted(other_id))
+        return i < end and self._targets[i] == other_id
+
+    def row(self, user_id: Optional[int]):
+        if user_id is None:
+            return _NO_EDGES
+        ids = self._base(user_id)
+        removed = self._removed.get(user_id)
+        if removed:
+            ids = ids[~np.isin(ids, np.fromiter(removed, dtype=np.uint32, count=len(removed)))]
+        added = self._added.get(user_id)
+        if added:
+            ids = np.union1d(ids, np.fromiter(added, dtype=np.uint32, count=len(added)))
+        return CsrRow(ids)
+
+    def degree(self, user_id: Optional[int]) -> int:
+        """len(row(user_id)) without building the row: added ids are never in the base, removed ones always are"""
+        if user_id is None:
+            return 0
+        count = 0
+        if user_id < len(self._offsets) - 1:
+            count = int(self._offsets[user_id + 1] - self._offsets[user_id])
+        return count + len(self._added.get(user_id, ())) - len(self._removed.get(user_id, ()))
+
+    def add(self, user_id: int, other_id: int) -> bool:
+        if self._in_base(user_id, other_id):
+            #ghablan hazf shode bood, faghat az removed dar miyad
+            removed = self._removed.get(user_id)
+            return removed is not None and removed.discard(other_id)
+        added = self._added.get(user_id)
+        if added is None:
+            added = self._added[user_id] = IdSet()
+        if not added.add(other_id):
+            return False
+        self._buffered()
+        return True
+
+    def discard(self, user_id: int, other_id: int) -> bool:
+        added = self._added.get(user_id)
+        if added is not None and added.discard(other_id):
+            return True
+        if not self._in_base(user_id, other_id):
+            return False
+        removed = self._removed.get(user_id)
+        if removed is None:
+            removed = self._removed[user_id] = IdSet()
+        if not removed.add(other_id):
+            return False
+        self._buffered()
+        return True
+
+    def _buffered(self):
+        self._pending += 1
+        #astane ba andaze graph bozorg mishe ke load kardan ye graph bozorg O(E^2) nashe
+        if self._pending > max(CSR_MERGE_EDGES, len(self._targets) // 4):
+            self.merge()
+
+    @staticmethod
+    def _pairs(delta: Dict[int, IdSet]):
+        #har edge ye kilid u64: (user << 32) | neighbour, ke sort shode hamoon tartib CSR-e
+        keys = np.fromiter((user_id << 32 | other_id for user_id, ids in delta.items() for other_id in ids),
+                           dtype=np.uint64, count=sum(len(ids) for ids in delta.values()))
+        keys.sort()
+        return keys
+
+    def merge(self):
+        """fold the added/removed buffers into the CSR arrays"""
+        users_count = len(self._offsets) - 1
+        sources = np.repeat(np.arange(users_count, dtype=np.uint64), np.diff(self._offsets))
+        keys = (sources << np.uint64(32)) | self._targets.astype(np.uint64)
+        if self._removed:
+            keys = keys[~np.isin(keys, self._pairs(self._removed))]
+        if self._added:
+            keys = np.union1d(keys, self._pairs(self._added))
+        sources = keys >> np.uint64(32)
+        self._targets = (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        if len(sources):
+            #two_hop row-e har neighbour ro mikhoone, pas user haye faghat target ham row (khali) migiran
+            users_count = max(users_count, int(sources[-1]) + 1, int(self._targets.max()) + 1)
+        self._offsets = np.searchsorted(sources, np.arange(users_count + 1, dtype=np.uint64)).astype(np.int64)
+        self._added = {}
+        self._removed = {}
+        self._pending = 0
+
+    def two_hop(self, user_id: int) -> Counter:
+        if self._added or self._removed:
+            self.merge()
+        firsts = self._base(user_id).astype(np.int64)
+        starts, ends = self._offsets[firsts], self._offsets[firsts + 1]
+        #hame row haye neighbour ha ba ye gather: index har edge = start row-esh + fasele az avval
+        lengths = ends - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        ids, counts = np.unique(self._targets[positions], return_counts=True)
+        return Counter(dict(zip(ids.tolist(), counts.tolist())))
+
+
+class SocialGraph:
+    """follow and block edges between users, stored once with reverse indexes"""
+
+    #edge ha be id adadi user ha hastan; username faghat to API miad va mire.
+    #follow ha be adjacency dade mishan (IdSetAdjacency ya CsrAdjacency), block ha hamishe IdSet
+    def __init__(self, adjacency=IdSetAdjacency):
+        self._following = adjacency()
+        self._followers = adjacency()
+        self._blocked = IdSetAdjacency()
+        self._blocked_by = IdSetAdjacency()
+
+    def clear(self):
+        self._following.clear()
+        self._followers.clear()
+        self._blocked.clear()
+        self._blocked_by.clear()
+
+    @staticmethod
+    def _peek(index, username: str):
+        return index.row(user_ids.get(username))
+
+    @staticmethod
+    def _note(username: str, field: str, op: str, other: str):
+        #taghir ro be unit of work midim ke mesl ghabl be shekl delta zakhire beshe
+        user = users.get(username)
+        if user is not None:
+            user.note_delta(field, op, other)
+
+    def following(self, username: str) -> NameView:
+        return NameView(self._peek(self._following, username))
+
+    def followers(self, username: str) -> NameView:
+        return NameView(self._peek(self._followers, username))
+
+    def blocked(self, username: str) -> NameView:
+        return NameView(self._peek(self._blocked, username))
+
+    def blocked_by(self, username: str) -> NameView:
+        return NameView(self._peek(self._blocked_by, username))
+
+    def is_following(self, username: str, other: str) -> bool:
+        other_id = user_ids.get(other)
+        return other_id is not None and other_id in self._peek(self._following, username)
+
+    def is_blocked(self, username: str, other: str) -> bool:
+        """True if username has blocked other"""
+        other_id = user_ids.get(other)
+        return other_id is not None and other_id in self._peek(self._blocked, username)
+
+    def is_mutual(self, username: str, other: str) -> bool:
+        return self.is_following(username, other) and self.is_following(other, username)
+
+    def common_followers(self, username: str, other: str) -> List[str]:
+        common = self._peek(self._followers, username) & self._peek(self._followers, other)
+        return [user_ids.name_of(user_id) for user_id in common]
+
+    def follower_count(self, username: str) -> int:
+        return self._followers.degree(user_ids.get(username))
+
+    def mutual_connections(self, username: str, other: str) -> int:
+        """how many accounts username follows also follow other"""
+        return len(self._peek(self._following, username) & self._peek(self._followers, other))
+
+    def friends_of_friends(self, username: str, limit: int = 10) -> List[str]:
+        """accounts followed by the people username follows, most shared first"""
+        user_id = user_ids.get(username)
+        if user_id is None:
+            return []
+        following = set(self._following.row(user_id))
+        counts = self._following.two_hop(user_id)
+        best = heapq.nlargest(limit, (item for item in counts.items()
+                                      if item[0] != user_id and item[0] not in following),
+                             key=lambda item: (item[1], -item[0]))
+        return [user_ids.name_of(other_id) for other_id, _ in best]
+
+    def follow(self, username: str, other: str) -> bool:
+        user_id, other_id = user_ids.id_of(username), user_ids.id_of(other)
+        if not self._following.add(user_id, other_id):
+            return False
+        self._followers.add(other_id, user_id)
+        self._note(username, "following", "+", other)
+        self._note(other, "followers", "+", username)
+        visibility.invalidate(username, other)
+        timelines.on_follow(username, other)
+        return True
+
+    def unfollow(self, username: str, other: str) -> bool:
+        user_id, other_id = user_ids.get(username), user_ids.get(other)
+        if user_id is None or other_id is None or not self._following.discard(user_id, other_id):
+            return False
+        self._followers.discard(other_id, user_id)
+        self._note(username, "following", "-", other)
+        self._note(other, "followers", "-", username)
+        visibility.invalidate(username, other)
+        timelines.on_unfollow(username, other)
+        return True
+
+    def block(self, username: str, other: str) -> bool:
+        user_id, other_id = user_ids.id_of(username), user_ids.id_of(other)
+        if not self._blocked.add(user_id, other_id):
+            return False
+        self._blocked_by.add(other_id, user_id)
+        self._note(username, "blocked_users", "+", other)
+        #block follow ro az har do taraf ghat mikone
+        self.unfollow(username, other)
+        self.unfollow(other, username)
+        visibility.invalidate(username, other)
+        return True
+
+    def unblock(self, username: str, other: str) -> bool:
+        user_id, other_id = user_ids.get(username), user_ids.get(other)
+        if user_id is None or other_id is None or not self._blocked.discard(user_id, other_id):
+            return False
+        self._blocked_by.discard(other_id, user_id)
+        self._note(username, "blocked_users", "-", other)
+        visibility.invalidate(username, other)
+        return True
+
+    #baraye from_dict/restore: list ye field kamel jaygozin mishe; faghat farghesh
+    #avaz mishe, chon moghe load followers/following har edge ro do bar miyaran
+    def _replace(self, current: NameView, others, remove, add):
+        others = list(others)
+        keep = {user_ids.id_of(other) for other in others}
+        for other in [name for name in current if user_ids.get(name) not in keep]:
+            remove(other)
+        for other in others:
+            add(other)
+
+    def set_following(self, username: str, others):
+        self._replace(self.following(username), others,
+                      lambda other: self.unfollow(username, other), lambda other: self.follow(username, other))
+
+    def set_followers(self, username: str, others):
+        self._replace(self.followers(username), others,
+                      lambda other: self.unfollow(other, username), lambda other: self.follow(other, username))
+
+    def set_blocked(self, username: str, others):
+        self._replace(self.blocked(username), others,
+                      lambda other: self.unblock(username, other), lambda other: self.block(username, other))
+
+def make_graph(backend: str = GRAPH_BACKEND) -> SocialGraph:
+    if backend == "csr":
+        if np is not None:
+            return SocialGraph(CsrAdjacency)
+        console.print("[yellow]numpy is not installed, using the set based graph[/]")
+    return SocialGraph()
+
+graph = make_graph()
+
+
+class TimelineService:
+    """bounded per-user home timelines, filled when posts are written (fan-out on write)"""
+
+    def __init__(self, size: int = TIMELINE_SIZE):
+        self.size = size
+        #username -> id post ha, az ghadimi be jadid; faghat baraye karbar hayi ke
+        #timeline eshoon yek bar sakhte shode (baghiye ba avalin read sakhte mishan)
+        self._timelines: Dict[str, List[int]] = {}
+        #username -> floor: post haye ghadimi tar az floor momkene to timeline nabashan (0 yani hame hastan).
+        #az tool timeline dar nemiyad, chon unfollow timeline por ro kootah mikone
+        self._floors: Dict[str, int] = {}
+
+    def clear(self):
+        self._timelines.clear()
+        self._floors.clear()
 
-def save_data():
-    try:
-        users_data = {username: user.to_dict() for username, user in users.items()}
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(users_data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        console.print(f"[red]error in saving users {e}[/]")
+    def _timeline(self, username: str) -> List[int]:
+        timeline = self._timelines.get(username)
+        if timeline is None:
+            timeline = self._timelines[username] = storage.feed_post_ids(username, self.size)
+            self._floors[username] = timeline[0] if len(timeline) >= self.size else 0
+        return timeline
 
-    try:
-        posts_data = [post.to_dict() for post in posts]
-        with open(POSTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(posts_data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        console.print(f"[red]error in saving posts {e}[/]")
+    def _trim(self, username: str, timeline: List[int]):
+        if len(timeline) > self.size:
+            del timeline[:len(timeline) - self.size]
+            self._floors[username] = max(self._floors.get(username, 0), timeline[0])
+
+    def feed_page(self, username: str, cursor: Optional[str] = None,
+                  page_size: int = FEED_PAGE_SIZE) -> Tuple[List[int], Optional[str]]:
+        """one page of post ids newest first, plus the cursor of the next page (None at the end)"""
+        before = decode_feed_cursor(cursor)
+        wanted = page_size + 1
+        page = []
+        #post hayi ke username nemitoone bebine (block, private) rad mishan va ja-shoon por mishe
+        while len(page) < wanted:
+            batch = self._newest(username, before, wanted - len(page))
+            if not batch:
+                break
+            before = batch[-1]
+            page += [post_id for post_id in batch if visibility.can_see_post(username, post_id)]
+
+        if len(page) > page_size:
+            return page[:page_size], encode_feed_cursor(page[page_size - 1])
+        return page, None
+
+    def _newest(self, username: str, before: Optional[int], limit: int) -> List[int]:
+        timeline = self._timeline(username)
+        floor = self._floors[username]
+
+        page = []
+        if before is None or before > floor:
+            celebrities = [users[author].posts for author in graph.following(username) if is_celebrity(author)]
+            page = merge_newest([timeline, *celebrities], before, limit, floor)
+        if len(page) < limit and floor:
+            #zir timeline: fan-out on read roye hame kasayi ke follow mikone
+            below = floor if before is None else min(before, floor)
+            authors = [users[author].posts for author in graph.following(username) if author in users]
+            page += merge_newest(authors, below, limit - len(page))
+        return page
+
+    def on_post(self, post: 'Post'):
+        if is_celebrity(post.author):
+            return
+        for follower in graph.followers(post.author):
+            timeline = self._timelines.get(follower)
+            if timeline is not None:
+                bisect.insort(timeline, post.id)
+                self._trim(follower, timeline)
+
+    def on_follow(self, username: str, other: str):
+        if other in users:
+            self._backfill(username, other)
+
+    def _backfill(self, username: str, other: str):
+        timeline = self._timelines.get(username)
+        if timeline is None:
+            return
+        #jadid tarin post haye other ba timeline ghati mishe; baziyash momkene ghablan oomade bashe
+        author_posts = users[other].posts
+        if len(author_posts) > self.size:
+            #post haye ghadimi tar other nayoomadan
+            self._floors[username] = max(self._floors[username], author_posts[-self.size])
+        timeline[:] = sorted(set(timeline).union(author_posts[-self.size:]))
+        self._trim(username, timeline)
+
+    def on_unfollow(self, username: str, other: str):
+        if other not in users:
+            return
+        if graph.follower_count(other) == CELEBRITY_FOLLOWERS - 1:
+            #other alan az celebrity biroon oomad: post hayi ke on_post fan-out nakard va _newest
+            #dige merge nemikone bayad to timeline follower ha beran
+            for follower in graph.followers(other):
+                self._backfill(follower, other)
+        timeline = self._timelines.get(username)
+        if not timeline:
+            return
+        #faghat post haye jadid tar az ghadimi tarin post timeline momkene toosh bashan
+        author_posts = users[other].posts
+        start = bisect.bisect_left(author_posts, timeline[0])
+        removed = set(author_posts[start:])
+        if removed:
+            timeline[:] = [post_id for post_id in timeline if post_id not in removed]
+
+timelines = TimelineService()
+
+
+class Visibility:
+    """can a viewer see an author's posts: not blocked either way, and public or followed"""
+
+    def __init__(self, size: int = VISIBILITY_CACHE_SIZE):
+        self.size = size
+        #author -> viewer -> javab; ba follow/unfollow/block/private avaz mishe
+        self._cache: Dict[str, Dict[str, bool]] = {}
+        self._entries = 0
+
+    def clear(self):
+        self._cache.clear()
+        self._entries = 0
+
+    def blocked_between(self, username: str, other: str) -> bool:
+        return graph.is_blocked(username, other) or graph.is_blocked(other, username)
+
+    def can_see(self, viewer: str, author: str) -> bool:
+        if viewer == author:
+            return True
+        viewers = self._cache.get(author)
+        if viewers is not None and viewer in viewers:
+            return viewers[viewer]
+        user = users.get(author)
+        visible = (user is not None and not self.blocked_between(viewer, author)
+                   and (not user.is_private or graph.is_following(viewer, author)))
+        if self._entries >= self.size:
+            self.clear()
+        self._cache.setdefault(author, {})[viewer] = visible
+        self._entries += 1
+        return visible
+
+    def can_see_post(self, viewer: str, post_id: int) -> bool:
+        post = posts.get(post_id)
+        return post is not None and self.can_see(viewer, post.author)
+
+    def invalidate(self, username: str, other: str):
+        for author, viewer in ((username, other), (other, username)):
+            viewers = self._cache.get(author)
+            if viewers is not None and viewers.pop(viewer, None) is not None:
+                self._entries -= 1
+
+    def forget(self, author: str):
+        """drop every answer about author, e.g. after a privacy change"""
+        self._entries -= len(self._cache.pop(author, ()))
+
+visibility = Visibility()
+
+def is_celebrity(username: str) -> bool:
+    return graph.follower_count(username) >= CELEBRITY_FOLLOWERS
+
+def merge_newest(sources: List[List[int]], before: Optional[int], limit: int, floor: int = 0) -> List[int]:
+    """k-way merge of ascending id lists: up to limit distinct ids < before and >= floor, newest first"""
+    heap = []
+    for number, ids in enumerate(sources):
+        index = (len(ids) if before is None else bisect.bisect_left(ids, before)) - 1
+        if index >= 0 and ids[index] >= floor:
+            heap.append((-ids[index], number, index))
+    heapq.heapify(heap)
+
+    result = []
+    while heap and len(result) < limit:
+        negative_id, number, index = heapq.heappop(heap)
+        if not result or result[-1] != -negative_id:
+            result.append(-negative_id)
+        index -= 1
+        if index >= 0 and sources[number][index] >= floor:
+            heapq.heappush(heap, (-sources[number][index], number, index))
+    return result
+
+#cursor baraye karbar ye string bi mani hast, dar vaghe id akharin post safhe
+def encode_feed_cursor(post_id: int) -> str:
+    return base64.urlsafe_b64encode(struct.pack(">Q", post_id)).decode("ascii")
+
+def decode_feed_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    return struct.unpack(">Q", base64.urlsafe_b64decode(cursor.encode("ascii")))[0]
+
+
+class UsernameIndex:
+    """substring and prefix search over usernames, case-insensitive"""
+    #gram haye 1 ta 3 harfi -> shomare user ha; query ta 3 harf mostaghim javab dare,
+    #bozorg tar az oon roye kam tedad tarin trigram-esh check mishe
+    GRAM = 3
+
+    def __init__(self):
+        self._names: List[str] = []
+        self._grams: Dict[str, array] = {}
+        #esm haye lowercase morattab baraye prefix ba bisect, va shomare user har kodoom
+        self._keys: List[str] = []
+        self._key_ids = array("I")
+        #index ta avalin search sakhte nemishe ke startup kond nashe
+        self._pending = None
+
+    def clear(self):
+        self.__init__()
+
+    def rebuild(self, usernames):
+        """index usernames (e.g. the users dict) lazily, on the first search"""
+        self.clear()
+        self._pending = usernames
+
+    def _build(self):
+        #moghe load ye bar sort mikonim, na insert morattab baraye har user
+        usernames, self._pending = self._pending, None
+        for username in usernames:
+            self._add_grams(username)
+        order = sorted(range(len(self._names)), key=lambda ordinal: self._names[ordinal].lower())
+        self._keys = [self._names[ordinal].lower() for ordinal in order]
+        self._key_ids = array("I", order)
+
+    def _add_grams(self, username: str) -> str:
+        ordinal = len(self._names)
+        self._names.append(username)
+        key = username.lower()
+        for gram in {key[i:i + n] for n in range(1, self.GRAM + 1) for i in range(len(key) - n + 1)}:
+            postings = self._grams.get(gram)
+            if postings is None:
+                postings = self._grams[gram] = array("I")
+            postings.append(ordinal)
+        return key
+
+    def add(self, username: str):
+        if self._pending is not None:
+            #hanooz sakhte nashode; moghe sakhtan az khod users miad
+            return
+        ordinal = len(self._names)
+        key = self._add_grams(username)
+        index = bisect.bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._key_ids.insert(index, ordinal)
+
+    def prefix(self, query: str):
+        """usernames starting with query, alphabetically"""
+        if self._pending is not None:
+            self._build()
+        key = query.lower()
+        index = bisect.bisect_left(self._keys, key)
+        while index < len(self._keys) and self._keys[index].startswith(key):
+            yield self._names[self._key_ids[index]]
+            index += 1
+
+    def substring(self, query: str):
+        """usernames containing query, in the order they were added"""
+        if self._pending is not None:
+            self._build()
+        key = query.lower()
+        if len(key) <= self.GRAM:
+            for ordinal in self._grams.get(key, ()):
+                yield self._names[ordinal]
+            return
+        rarest = min((self._grams.get(key[i:i + self.GRAM], ()) for i in range(len(key) - self.GRAM + 1)), key=len)
+        for ordinal in rarest:
+            if key in self._names[ordinal].lower():
+                yield self._names[ordinal]
+
+    def fuzzy(self, query: str, max_edits: int):
+        """usernames that don't contain query but start with something within max_edits typos of it"""
+        if self._pending is not None:
+            self._build()
+        key = query.lower()
+        bigrams = {key[i:i + 2] for i in range(len(key) - 1)}
+        if not max_edits or not bigrams:
+            return
+        #har typo hadaksar 3 ta bigram ro kharab mikone (jabeja kardan do harf)
+        needed = max(1, len(bigrams) - 3 * max_edits)
+        shared = Counter()
+        for bigram in bigrams:
+            shared.update(self._grams.get(bigram, ()))
+        for ordinal, count in shared.items():
+            if count < needed:
+                continue
+            lowered = self._names[ordinal].lower()
+            if key in lowered:
+                continue
+            if len(lowered) >= len(key) - max_edits and edit_distance(key, lowered, max_edits, prefix=True) <= max_edits:
+                yield self._names[ordinal]
+
+username_index = UsernameIndex()
+
+def edit_distance(a: str, b: str, limit: int, prefix: bool = False) -> int:
+    """levenshtein distance with adjacent swaps; stops early and returns limit + 1 once it is over limit.
+    with prefix=True it is the distance from a to the closest prefix of b"""
+    if prefix:
+        b = b[:len(a) + limit]
+    elif abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(min(previous) if prefix else previous[-1], limit + 1)
+
+def typo_budget(query: str) -> int:
+    #query haye koochik ba typo ham be hame chi match mishan
+    return 0 if len(query) < 3 else 1 if len(query) < 6 else 2
+
+def search_ranked(query: str, current_user: str, limit: int = SEARCH_LIMIT) -> List[str]:
+    """best limit usernames for query: exact, then prefix, then substring, then typo matches;
+    inside each, more followers and mutual connections first; blocks both ways are hidden"""
+    key = query.lower()
+    if not key:
+        return []
+
+    def visible(username: str) -> bool:
+        return username != current_user and not visibility.blocked_between(current_user, username)
+
+    def order(tier: int, score: int, username: str):
+        #emtiaz barabar: esm kootah tar (nazdik tar be query) aval, baad alphabetic
+        return -tier, -score, len(username), username.lower()
+
+    tiers = (
+        (2, username_index.prefix(key)),
+        (1, (username for username in username_index.substring(key) if not username.lower().startswith(key))),
+        (0, username_index.fuzzy(key, typo_budget(key))),
+    )
+    size = limit * SEARCH_RERANK
+    shortlist = []
+    for tier, names in tiers:
+        #tier bala tar hamishe jolo tare, pas vaghti shortlist por shod tier haye baadi lazem nistan
+        if len(shortlist) >= size:
+            break
+        shortlist += heapq.nsmallest(size - len(shortlist), (
+            (tier + (tier == 2 and username.lower() == key), graph.follower_count(username), username)
+            for username in names if visible(username)), key=lambda item: order(*item))
+
+    #mutual ha geroon tar hastan, faghat baraye shortlist hesab mishan
+    ranked = heapq.nsmallest(limit, shortlist, key=lambda item: order(
+        item[0], item[1] + SEARCH_MUTUAL_WEIGHT * graph.mutual_connections(current_user, item[2]), item[2]))
+    return [username for _, _, username in ranked]
 
 
 #the main classes of our code
 #each of users has these 
-class User:
+class User(Entity):
+    KIND = "user"
+    FIELDS = ("username", "email", "password", "bio", "followers", "following", "posts",
+              "saved_posts", "blocked_users", "is_private", "created_at")
+    NAME_FIELDS = ("username",)
+    #followers/following/blocked_users to graph hastan, slot nemikhan
+    __slots__ = ("username", "email", "password", "bio", "posts", "saved_posts", "is_private", "created_at")
+
     def __init__(self, username:str, email: str, password:str):
         self.username= username
         self.email= email
         self.password= password
         self.bio= ""
-        self.followers=[]
-        self.following=[]
+        #followers/following/blocked_users to graph hastan; khali kardaneshoon edge haye
+        #user haye ghablan load shode ro pak mikone, pas faghat dirty mishan
+        for field in ("followers", "following", "blocked_users"):
+            self.mark_dirty(field)
         self.posts=[]
         self.saved_posts=[]
-        self.blocked_users=[]
         self.is_private = False  #by default baraye hame hesab ha ke public hastan
-        self.created_at= datetime.now().isoformat()    
+        self.created_at= now_us()
+
+    def key(self) -> str:
+        return self.username
+
+    @property
+    def user_id(self) -> int:
+        return user_ids.id_of(self.username)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name == "is_private":
+            visibility.forget(self.username)
+
+    #followers/following/blocked_users to graph zakhire mishan, inja faghat view hastan
+    @property
+    def followers(self):
+        return graph.followers(self.username)
+
+    @followers.setter
+    def followers(self, names):
+        graph.set_followers(self.username, names)
+
+    @property
+    def following(self):
+        return graph.following(self.username)
+
+    @following.setter
+    def following(self, names):
+        graph.set_following(self.username, names)
+
+    @property
+    def blocked_users(self):
+        return graph.blocked(self.username)
+
+    @blocked_users.setter
+    def blocked_users(self, names):
+        graph.set_blocked(self.username, names)
+
+    def apply_delta(self, field: str, op: str, item):
+        if field in GRAPH_DELTAS:
+            method, swap = GRAPH_DELTAS[field][op]
+            getattr(graph, method)(*((item, self.username) if swap else (self.username, item)))
+        else:
+            super().apply_delta(field, op, item)
         
     def to_dict(self) -> Dict:
         return {
@@ -83,13 +2549,13 @@ class User:
             "email": self.email,
             "password": self.password,
             "bio": self.bio,
-            "followers": self.followers,
-            "following": self.following,
+            "followers": list(self.followers),
+            "following": list(self.following),
             "posts": self.posts,
             "saved_posts": self.saved_posts,
-            "blocked_users": self.blocked_users,
+            "blocked_users": list(self.blocked_users),
             "is_private": self.is_private,
-            "created_at": self.created_at
+            "created_at": to_iso(self.created_at)
         }
 
     @classmethod
@@ -102,18 +2568,53 @@ class User:
         user.saved_posts = data.get("saved_posts", [])
         user.blocked_users = data.get("blocked_users", [])
         user.is_private = data.get("is_private", False)
-        user.created_at = data.get("created_at", datetime.now().isoformat())
+        user.created_at = data.get("created_at", now_us())
         return user
     
-class Post:
+#field -> op -> (method graph, aya username ha jabeja beshan)
+GRAPH_DELTAS = {
+    "following": {"+": ("follow", False), "-": ("unfollow", False)},
+    "followers": {"+": ("follow", True), "-": ("unfollow", True)},
+    "blocked_users": {"+": ("block", False), "-": ("unblock", False)},
+}
+    
+class Post(Entity):
+    KIND = "post"
+    FIELDS = ("id", "author", "caption", "image_path", "likes", "comments", "created_at")
+    NAME_FIELDS = ("author",)
+    SET_FIELDS = {"likes": LikeSet}
+    __slots__ = FIELDS
+
     def __init__(self, author: str, caption: str, image_path: str = ""):
-        self.id = len(posts) + 1
+        self.id = id_generator.next_id()
         self.author = author
         self.caption = caption
         self.image_path = image_path
         self.likes = []
         self.comments = []
-        self.created_at = datetime.now().isoformat()
+        self.created_at = now_us()
+
+    def key(self) -> int:
+        return self.id
+
+    @property
+    def like_count(self) -> int:
+        return len(self.likes)
+
+    def has_liked(self, username: str) -> bool:
+        return username in self.likes
+
+    def toggle_like(self, username: str) -> bool:
+        """like or unlike; returns True if the post is now liked by username"""
+        if self.likes.discard(username):
+            return False
+        self.likes.add(username)
+        return True
+
+    def liked_by_following(self, username: str) -> List[str]:
+        """which of the accounts username follows liked this post"""
+        #IdSet/IdBitmap & rooye koochik tar migarde va to bozorg tar membership mizane
+        return [user_ids.name_of(user_id) for user_id in graph.following(username).ids() & self.likes.ids()]
 
     def to_dict(self) -> Dict:
         return {
@@ -121,21 +2622,449 @@ class Post:
             "author": self.author,
             "caption": self.caption,
             "image_path": self.image_path,
-            "likes": self.likes,
+            "likes": list(self.likes),
             "comments": self.comments,
-            "created_at": self.created_at
+            "created_at": to_iso(self.created_at)
         }
 
     @classmethod
     def from_dict(cls, data: Dict) -> 'Post':
-        post = cls(data["author"], data["caption"], data.get("image_path", ""))
-        post.id = data["id"]
-        post.likes = data.get("likes", [])
-        post.comments = data.get("comments", [])
-        post.created_at = data.get("created_at", datetime.now().isoformat())
-        return post
+        #post zakhire shode id-esh ro dare; __init__ faghat baraye post jadid id misaze
+        return cls.restore({
+            "id": data["id"],
+            "author": data["author"],
+            "caption": data["caption"],
+            "image_path": data.get("image_path", ""),
+            "likes": data.get("likes", []),
+            "comments": data.get("comments", []),
+            "created_at": data.get("created_at", now_us()),
+        })
     
 
+class EngagementStats:
+    """one row per post as numpy columns (id, author id, created_at epoch, likes, comments);
+    aggregates are group-bys over these instead of loops over Post objects"""
+
+    def __init__(self, post_ids, author_ids, created, like_counts, comment_counts):
+        self.post_ids = post_ids
+        self.author_ids = author_ids
+        self.created = created
+        self.like_counts = like_counts
+        self.comment_counts = comment_counts
+
+    @classmethod
+    def build(cls, store: Optional[PostStore] = None, comment_store: Optional[CommentStore] = None,
+              post_ids: Optional[List[int]] = None) -> 'EngagementStats':
+        """columns for every post in store, or only for post_ids (e.g. User.posts) without decoding the rest"""
+        store = posts if store is None else store
+        comment_store = comments if comment_store is None else comment_store
+        selected = store if post_ids is None else [store[post_id] for post_id in post_ids if post_id in store]
+        post_ids, author_ids, like_counts, created = [], [], [], []
+        for post in selected:
+            post_ids.append(post.id)
+            author_ids.append(user_ids.id_of(post.author))
+            like_counts.append(len(post.likes))
+            created.append(post.created_at)
+        post_ids = np.array(post_ids, dtype=np.uint64)
+        author_ids = np.array(author_ids, dtype=np.uint32)
+        like_counts = np.array(like_counts, dtype=np.int64)
+        created = np.array(created, dtype=np.int64) // 1000000
+        if selected is not store:
+            #chand ta post: shomaresh mostaghim az CommentStore, bedoone group-by roye hame comment ha
+            comment_counts = np.array([comment_store.count(post_id) for post_id in post_ids.tolist()], dtype=np.int64)
+            return cls(post_ids, author_ids, created, like_counts, comment_counts)
+
+        #comment ha ye jadval joda hastan: aval shomaresh be ezaye post, bad peyda kardan satr post
+        commented, counts = np.unique(np.frombuffer(comment_store.post_ids(), dtype=np.uint64), return_counts=True)
+        comment_counts = np.zeros(len(post_ids), dtype=np.int64)
+        if len(post_ids) and len(commented):
+            order = np.argsort(post_ids)
+            rows = order[np.searchsorted(post_ids, commented, sorter=order).clip(max=len(order) - 1)]
+            known = post_ids[rows] == commented
+            comment_counts[rows[known]] = counts[known]
+        return cls(post_ids, author_ids, created, like_counts, comment_counts)
+
+    def __len__(self) -> int:
+        return len(self.post_ids)
+
+    def _select(self, mask) -> 'EngagementStats':
+        return EngagementStats(self.post_ids[mask], self.author_ids[mask], self.created[mask],
+                               self.like_counts[mask], self.comment_counts[mask])
+
+    def of_author(self, username: str) -> 'EngagementStats':
+        return self._select(self.author_ids == user_ids.id_of(username))
+
+    def since_days(self, days: int) -> 'EngagementStats':
+        return self._select(self.created >= now_us() // 1000000 - days * 86400)
+
+    def summary(self, percentiles=(50, 90, 99)) -> Dict:
+        """totals, means and percentiles of likes and comments per post"""
+        result = {"posts": len(self), "likes": int(self.like_counts.sum()), "comments": int(self.comment_counts.sum())}
+        for name, column in (("likes", self.like_counts), ("comments", self.comment_counts)):
+            result[f"{name}_mean"] = float(column.mean()) if len(column) else 0.0
+            values = np.percentile(column, percentiles) if len(column) else [0.0] * len(percentiles)
+            result[f"{name}_p"] = dict(zip(percentiles, map(float, values)))
+        return result
+
+    def per_author(self, limit: int = 10) -> List[Tuple[str, int, int, int]]:
+        """(author, posts, likes, comments) for the most liked authors"""
+        if not len(self):
+            return []
+        #id user ha ye bazeye fashorde hastan, bincount hamoon group-by hast
+        post_counts = np.bincount(self.author_ids)
+        likes = np.bincount(self.author_ids, weights=self.like_counts).astype(np.int64)
+        comment_totals = np.bincount(self.author_ids, weights=self.comment_counts).astype(np.int64)
+        authors = np.flatnonzero(post_counts)
+        best = authors[np.lexsort((authors, -likes[authors]))[:limit]]
+        return [(user_ids.name_of(int(author_id)), int(post_counts[author_id]), int(likes[author_id]),
+                 int(comment_totals[author_id])) for author_id in best]
+
+    def top_per_day(self, n: int = STATS_TOP_N) -> List[Tuple[str, List[Tuple[int, int, int]]]]:
+        """for each day, newest day first: the n posts with the most likes + comments"""
+        if not len(self):
+            return []
+        days = self.created // 86400
+        score = self.like_counts + self.comment_counts
+        #sort: rooz jadid aval, to har rooz emtiaz bishtar aval, bad id kamtar
+        order = np.lexsort((self.post_ids, -score, -days))
+        sorted_days = days[order]
+        starts = np.flatnonzero(np.r_[True, sorted_days[1:] != sorted_days[:-1]])
+        ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        keep = order[ranks < n]
+
+        result = []
+        for day, post_id, likes, comment_count in zip(days[keep].tolist(), self.post_ids[keep].tolist(),
+                                                      self.like_counts[keep].tolist(), self.comment_counts[keep].tolist()):
+            label = str(np.datetime64(day, "D"))
+            if not result or result[-1][0] != label:
+                result.append((label, []))
+            result[-1][1].append((post_id, likes, comment_count))
+        return result
+
+
+def follower_growth(username: str, days: int = STATS_DAYS) -> List[Tuple[str, int, int]]:
+    """(day, new followers, followers at end of day) for the last days.
+    follow edges have no timestamp, so only approved follow requests are dated (by when
+    they were sent) and only while the sender still follows; everything else is counted in the starting total"""
+    #age ye nafar chand bar request dade (unfollow, dobare request) faghat akharin approved hesab mishe
+    since: Dict[str, str] = {}
+    for request in follow_requests.approved(username):
+        sender = request["from_user"]
+        if graph.is_following(sender, username):
+            since[sender] = max(since.get(sender, request["created_at"]), request["created_at"])
+    approved = list(since.values())
+    today = now_us() // 86400000000
+    window = np.arange(today - days + 1, today + 1)
+    request_days = np.array(approved, dtype="datetime64[D]").astype(np.int64)
+    gained = np.bincount(np.searchsorted(window, request_days[request_days >= window[0]]), minlength=days)[:days]
+    totals = np.maximum(graph.follower_count(username) - gained[::-1].cumsum()[::-1] + gained, 0)
+    return [(str(np.datetime64(int(day), "D")), int(new), int(total))
+            for day, new, total in zip(window, gained, totals)]
+
+
+class ServiceError(Exception):
+    """a request InstagramService refuses; the message is meant for the user"""
+
+
+class InstagramService:
+    """what the app can do, without prompts or printing: every method takes the acting
+    username and arguments, returns a result or raises ServiceError"""
+
+    #state global hast (users, posts, graph, ...); ba in lock chand session to ye process
+    #(thread haye mokhtalef) taghirat va commit-eshoon ro yeki yeki anjam midan
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def _user(self, username: str) -> User:
+        user = users.get(username)
+        if user is None:
+            raise ServiceError("user not found!")
+        return user
+
+    def _post(self, viewer: str, post_id: int) -> Post:
+        post = posts.get(post_id)
+        if post is None or not visibility.can_see(viewer, post.author):
+            raise ServiceError("post not found!")
+        return post
+
+    #account
+
+    @staticmethod
+    def check_email(email: str):
+        if "@" not in email or "." not in email:
+            raise ServiceError("Invalid email format!")
+
+    @staticmethod
+    def check_username(username: str):
+        if username in users:
+            raise ServiceError("Username already exists! Please choose another")
+        if " " in username:
+            raise ServiceError("Username cannot contain spaces!")
+        if len(username) < 3:
+            raise ServiceError("Username must have at least 3 characters!")
+
+    @staticmethod
+    def check_password(password: str):
+        if len(password) < 6:
+            raise ServiceError("Password must have at least 6 characters!")
+
+    def register(self, username: str, email: str, password: str) -> User:
+        with self._lock:
+            self.check_email(email)
+            self.check_username(username)
+            self.check_password(password)
+            user = users[username] = User(username, email, password)
+            username_index.add(username)
+            commit()
+            return user
+
+    def login(self, username: str, password: str) -> User:
+        with self._lock:
+            if username not in users:
+                raise ServiceError("no username found!")
+            if users[username].password != password:
+                raise ServiceError("wrong password")
+            return users[username]
+
+    def get_user(self, username: str) -> User:
+        with self._lock:
+            return self._user(username)
+
+    def profile(self, viewer: str, username: str) -> User:
+        """username's profile as viewer sees it; hidden from people username blocked"""
+        with self._lock:
+            user = self._user(username)
+            if graph.is_blocked(username, viewer):
+                raise ServiceError("user not found!")
+            return user
+
+    def edit_bio(self, username: str, bio: str):
+        with self._lock:
+            self._user(username).bio = bio
+            commit()
+
+    def set_private(self, username: str, private: bool):
+        with self._lock:
+            self._user(username).is_private = private
+            commit()
+
+    def search(self, username: str, query: str, limit: int = SEARCH_LIMIT) -> List[str]:
+        with self._lock:
+            return storage.search_usernames(query, username, limit)
+
+    #follow va block
+
+    def follow(self, username: str, other: str) -> str:
+        """"following", or "requested"/"pending" for a private account"""
+        with self._lock:
+            self._user(username)
+            target = self._user(other)
+            if username == other:
+                raise ServiceError("you can't follow yourself!")
+            if visibility.blocked_between(username, other):
+                raise ServiceError(f"you can't follow {other}!")
+            if graph.is_following(username, other):
+                return "following"
+            if not target.is_private:
+                graph.follow(username, other)
+                commit()
+                return "following"
+            if follow_requests.pending(username, other):
+                return "pending"
+            request = {
+                "id": id_generator.next_id(),
+                "from_user": username,
+                "to_user": other,
+                "status": "pending",
+                "created_at": datetime.now().isoformat()
+            }
+            follow_requests.add(request)
+            unit_of_work.add_follow_request(request)
+            commit()
+            return "requested"
+
+    def is_following(self, username: str, other: str) -> bool:
+        with self._lock:
+            return graph.is_following(username, other)
+
+    def is_blocked(self, username: str, other: str) -> bool:
+        """True if username has blocked other"""
+        with self._lock:
+            return graph.is_blocked(username, other)
+
+    def unfollow(self, username: str, other: str) -> bool:
+        with self._lock:
+            self._user(username)
+            if not graph.unfollow(username, other):
+                return False
+            commit()
+            return True
+
+    def block(self, username: str, other: str) -> bool:
+        """block other; follows and pending follow requests in both directions are removed too"""
+        with self._lock:
+            self._user(username)
+            self._user(other)
+            if username == other:
+                raise ServiceError("you can't block yourself!")
+            if not graph.block(username, other):
+                return False
+            for request in (follow_requests.pending(username, other), follow_requests.pending(other, username)):
+                if request is not None:
+                    unit_of_work.add_follow_request(follow_requests.resolve(request["id"], "rejected"))
+            commit()
+            return True
+
+    def unblock(self, username: str, other: str) -> bool:
+        with self._lock:
+            self._user(username)
+            if not graph.unblock(username, other):
+                return False
+            commit()
+            return True
+
+    def blocked_users(self, username: str) -> List[str]:
+        with self._lock:
+            return list(graph.blocked(username))
+
+    def pending_follow_requests(self, username: str) -> List[Dict]:
+        """pending requests to username, oldest first"""
+        with self._lock:
+            return follow_requests.inbox(username)
+
+    def follow_request_count(self, username: str) -> int:
+        with self._lock:
+            return follow_requests.inbox_count(username)
+
+    def resolve_follow_requests(self, username: str, request_ids: List[int], approve: bool) -> List[Dict]:
+        """approve or reject requests to username together; one flush for all of them"""
+        with self._lock:
+            self._user(username)
+            requests = [follow_requests.get(request_id) for request_id in request_ids]
+            if any(request is None or request["to_user"] != username or request["status"] != "pending"
+                   for request in requests):
+                raise ServiceError("follow request not found!")
+            resolved = []
+            for request in requests:
+                #request-e beyn do nafari ke block hastan hich vaght approve nemishe
+                accept = approve and not visibility.blocked_between(request["from_user"], username)
+                resolved.append(follow_requests.resolve(request["id"], "approved" if accept else "rejected"))
+                unit_of_work.add_follow_request(resolved[-1])
+                if accept:
+                    graph.follow(request["from_user"], request["to_user"])
+            commit()
+            return resolved
+
+    #post ha
+
+    def create_post(self, username: str, caption: str, image_path: str = "") -> Post:
+        with self._lock:
+            user = self._user(username)
+            post = Post(username, caption, image_path)
+            posts.add(post)
+            user.posts.append(post.id)
+            timelines.on_post(post)
+            commit()
+            return post
+
+    def get_post(self, viewer: str, post_id: int) -> Post:
+        with self._lock:
+            return self._post(viewer, post_id)
+
+    def toggle_like(self, username: str, post_id: int) -> bool:
+        """like or unlike; True if the post is now liked"""
+        with self._lock:
+            self._user(username)
+            liked = self._post(username, post_id).toggle_like(username)
+            commit()
+            return liked
+
+    def comment(self, username: str, post_id: int, text: str) -> Dict:
+        with self._lock:
+            self._user(username)
+            post = self._post(username, post_id)
+            comment = {
+                "id": id_generator.next_id(),
+                "post_id": post.id,
+                "author": username,
+                "text": text,
+                "created_at": datetime.now().isoformat()
+            }
+            comments.add(comment)
+            unit_of_work.add_comment(comment)
+            post.comments.append(comment["id"])
+            commit()
+            return comment
+
+    def save_post(self, username: str, post_id: int) -> bool:
+        """False if it was already saved"""
+        with self._lock:
+            saved = self._user(username).saved_posts
+            self._post(username, post_id)
+            if post_id in saved:
+                return False
+            saved.append(post_id)
+            commit()
+            return True
+
+    def post_comments(self, viewer: str, post_id: int, offset: int = 0,
+                 limit: int = COMMENT_PAGE_SIZE) -> Tuple[List[Dict], Optional[int]]:
+        """comments newest first without blocked authors, plus the offset of the next page (None at the end)"""
+        with self._lock:
+            self._post(viewer, post_id)
+            page = comments.latest(post_id, offset, limit)
+            offset += len(page)
+            return ([comment for comment in page if not visibility.blocked_between(viewer, comment["author"])],
+                    offset if offset < comments.count(post_id) else None)
+
+    #safhe haye post: (post ha, offset/cursor safhe baad ya None)
+
+    def feed(self, username: str, cursor: Optional[str] = None,
+             page_size: int = FEED_PAGE_SIZE) -> Tuple[List[Post], Optional[str]]:
+        with self._lock:
+            self._user(username)
+            try:
+                decode_feed_cursor(cursor)
+            except (ValueError, struct.error):
+                #base64 ya toolesh kharab
+                raise ServiceError("invalid feed cursor!")
+            page_ids, next_cursor = timelines.feed_page(username, cursor, page_size)
+            return [posts[post_id] for post_id in page_ids], next_cursor
+
+    def check_can_view(self, viewer: str, username: str):
+        """raise if viewer may not see username's posts"""
+        with self._lock:
+            self._user(username)
+            if visibility.can_see(viewer, username):
+                return
+            if visibility.blocked_between(viewer, username):
+                raise ServiceError("posts of this user are not available!")
+            raise ServiceError("this account is private!")
+
+    def _visible_page(self, viewer: str, page: List[int], offset: int, limit: int) -> Tuple[List[Post], Optional[int]]:
+        #faghat hamin safhe resolve mishe, na kol list
+        visible = [post for post in map(posts.get, page)
+                   if post is not None and visibility.can_see(viewer, post.author)]
+        return visible, offset + len(page) if len(page) == limit else None
+
+    def user_posts(self, viewer: str, username: str, offset: int = 0,
+                   limit: int = FEED_PAGE_SIZE) -> Tuple[List[Post], Optional[int]]:
+        """username's posts newest first"""
+        with self._lock:
+            self.check_can_view(viewer, username)
+            return self._visible_page(viewer, storage.user_post_ids(username, offset, limit), offset, limit)
+
+    def saved_posts(self, username: str, offset: int = 0,
+                    limit: int = FEED_PAGE_SIZE) -> Tuple[List[Post], Optional[int]]:
+        """saved posts, last saved first; posts that became hidden are skipped"""
+        with self._lock:
+            saved = self._user(username).saved_posts
+            end = len(saved) - offset
+            return self._visible_page(username, saved[max(0, end - limit):max(0, end)][::-1], offset, limit)
+
+service = InstagramService()
+
+
 def initialize_data_directory():
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
@@ -150,8 +3079,10 @@ def register_user():
         email= Prompt.ask("Email (or type back to cancel)")
         if email.lower() == 'back':
             return None
-        if "@"not in email or "." not in email:
-            console.print("[red]Invalid email format!")
+        try:
+            service.check_email(email)
+        except ServiceError as e:
+            console.print(f"[red]{e}[/]")
             continue
         break
     
@@ -160,22 +3091,20 @@ def register_user():
         username = Prompt.ask("Username (or type back to cancel)")
         if username.lower()== 'back':
             return None
-        if username in users:
-            console.print("[red]Username already exists! Please choose another[/]")
-            continue
-        if " " in username:
-            console.print("[red]Username cannot contain spaces![/]")
-            continue
-        if len(username) < 3:
-            console.print("[red]Username must have at least 3 characters![/]")
+        try:
+            service.check_username(username)
+        except ServiceError as e:
+            console.print(f"[red]{e}[/]")
             continue
     
         #valid boodan password
         password =input("Password (or type back to cancel):")
         if password.lower() == 'back' :
             return None
-        if len(password) <6:
-            console.print("[red]Password must have at least 6 characters![/]")
+        try:
+            service.check_password(password)
+        except ServiceError as e:
+            console.print(f"[red]{e}[/]")
             continue
     
     #password confirmation
@@ -185,8 +3114,11 @@ def register_user():
             continue
         break
     
-    users[username] = User(username, email, password)
-    save_data()
+    try:
+        service.register(username, email, password)
+    except ServiceError as e:
+        console.print(f"[red]{e}[/]")
+        return None
     console.print(f"[green]{username}'s account has been created successfully![/]")
     return username
 
@@ -195,35 +3127,37 @@ def login_user() -> Optional[str]:
     console.print(Panel("login to account", style="blue"))
     
     username = Prompt.ask("username")
-    if username not in users:
-        console.print("[red]no username found![/]")
-        return None
-    
     password = input("password: ")
-    if users[username].password != password:
-        console.print("[red]wrong password[/]")
+    try:
+        service.login(username, password)
+    except ServiceError as e:
+        console.print(f"[red]{e}[/]")
         return None
     
     console.print(f"[green]welcome back {username}![/]")
     return username
 
 def home_screen(current_user: str):
+    #cursor safhe haye ghabli baraye "newer posts"
+    cursors = [None]
     while True:
         console.print(Panel(f" HOME  welcome dear {current_user} !", style= "blue"))
-        user = users[current_user]
-        following_posts = [post for post in posts if post.author in user.following]
+        following_posts, next_cursor = service.feed(current_user, cursors[-1])
         
         if not following_posts:
             console.print("No posts")
         else:
-            for post in following_posts:
-                display_post(post, current_user)
+            render_feed_page(following_posts, current_user)
         options= [
             ("1", "search for users"),
             ("2", "my profile"),
             ("3", "create new post"),
             ("4", "exit"),
         ]
+        if next_cursor is not None:
+            options.append(("5", "older posts"))
+        if len(cursors) > 1:
+            options.append(("6", "newer posts"))
         
         table = Table(show_header=False)
         table.add_column("choice", style="cyan")
@@ -233,8 +3167,15 @@ def home_screen(current_user: str):
             table.add_row(opt, desc)
 
         console.print(table)
+        if following_posts:
+            console.print(f"[cyan]{post_actions_hint(following_posts)}[/]")
 
-        choice = Prompt.ask("choose an option", choices=["1", "2", "3", "4"])
+        #ham gozine haye menu, ham action roye post ha (masalan "l 2") ba hamin ye prompt
+        while True:
+            choice, post = ask_post_action(following_posts, [opt for opt, _ in options])
+            if post is None:
+                break
+            act_on_post(choice, post, current_user)
 
         if choice == "1":
             search_users(current_user)
@@ -242,13 +3183,18 @@ def home_screen(current_user: str):
             profile_screen(current_user)
         elif choice == "3":
             create_post(current_user)
+            cursors = [None]
         elif choice == "4":
             return
+        elif choice == "5":
+            cursors.append(next_cursor)
+        elif choice == "6":
+            cursors.pop()
         
         
 def profile_screen(current_user: str):
 
-    user = users[current_user]
+    user = service.get_user(current_user)
     
     while True:
         console.print(Panel(f"*MY PROFILE* {current_user}", style="blue"))
@@ -267,7 +3213,9 @@ def profile_screen(current_user: str):
             ("3", "saved post"),
             ("4", "privacy settings"),
             ("5", "blocked users"),
-            ("6", "back")
+            ("6", f"follow requests ({service.follow_request_count(current_user)})"),
+            ("7", "my stats"),
+            ("8", "back")
         ]
         
         table = Table(show_header=False)
@@ -279,7 +3227,7 @@ def profile_screen(current_user: str):
         
         console.print(table)
         
-        choice = Prompt.ask("choose an option", choices=["1", "2", "3", "4", "5", "6"])
+        choice = Prompt.ask("choose an option", choices=["1", "2", "3", "4", "5", "6", "7", "8"])
         
         if choice == "1":
             edit_profile(current_user)
@@ -292,82 +3240,144 @@ def profile_screen(current_user: str):
         elif choice == "5":
             blocked_users(current_user)
         elif choice == "6":
+            follow_requests_screen(current_user)
+        elif choice == "7":
+            stats_screen(current_user)
+        elif choice == "8":
             return
         
         
+#action haye post to feed: harf + shomare post to safhe, masalan "l 2"
+POST_ACTIONS = {"l": "like", "c": "comment", "s": "save", "o": "open"}
+
+
+def liked_by_line(post: Post, current_user: str) -> str:
+    friends = post.liked_by_following(current_user)
+    if not friends:
+        return ""
+    return f"liked by {', '.join(friends[:3])}" + (f" and {len(friends) - 3} others" if len(friends) > 3 else "")
+
+
+def post_panel(post: Post, current_user: str, number: Optional[int] = None) -> Panel:
+    text = Text(f"{post.author} @ {format_minute(post.created_at)}\n\n{post.caption}\n\n"
+                f"❤ {post.like_count}   💬 {len(post.comments)}")
+    liked_by = liked_by_line(post, current_user)
+    if liked_by:
+        text.append(f"\n{liked_by}", style="dim")
+    title = f"#post{post.id}" if number is None else f"[{number}] #post{post.id}"
+    return Panel(text, title=title, border_style="green")
+
+
+def render_feed_page(page: List[Post], current_user: str):
+    """a whole page of posts, numbered from 1, in one print"""
+    if not console.is_terminal:
+        #khorooji terminal nist (pipe/file): matn sade, bedoone layout rich
+        lines = []
+        for number, post in enumerate(page, 1):
+            lines.append(f"[{number}] #post{post.id} {post.author} @ {format_minute(post.created_at)}")
+            lines.append(f"    {post.caption}")
+            lines.append(f"    likes {post.like_count}  comments {len(post.comments)}")
+            liked_by = liked_by_line(post, current_user)
+            if liked_by:
+                lines.append(f"    {liked_by}")
+        console.file.write("\n".join(lines) + "\n")
+        console.file.flush()
+        return
+    console.print(Group(*(post_panel(post, current_user, number) for number, post in enumerate(page, 1))))
+
+
+def ask_post_action(page: List[Post], options: List[str], default: Optional[str] = None) -> Tuple[str, Optional[Post]]:
+    """one prompt for a page: "l 2" / "c 2" / "s 2" / "o 2" act on post 2, or one of options as is"""
+    while True:
+        if default is None:
+            answer = Prompt.ask("choose an option")
+        else:
+            answer = Prompt.ask("choose an option", default=default)
+        answer = answer.strip().lower()
+        if answer in options:
+            return answer, None
+        action, number = answer[:1], answer[1:].strip()
+        if page and action in POST_ACTIONS and number.isdigit() and 1 <= int(number) <= len(page):
+            return action, page[int(number) - 1]
+        console.print(f"[red]use one of {', '.join(options)} or an action and a post number, like l 1[/]")
+
+
+def post_actions_hint(page: List[Post]) -> str:
+    return f"l/c/s/o 1-{len(page)}: like, comment, save or open a post"
+
+
+def act_on_post(action: str, post: Post, current_user: str):
+    try:
+        if action == "l":
+            if service.toggle_like(current_user, post.id):
+                console.print("[green]you liked a post![/]")
+            else:
+                console.print("[yellow]you unliked![/]")
+        elif action == "c":
+            add_comment(post, current_user)
+        elif action == "s":
+            if service.save_post(current_user, post.id):
+                console.print("[green]post has been saved![/]")
+            else:
+                console.print("[yellow]this post has already been saved before![/]")
+        elif action == "o":
+            display_post(post, current_user)
+    except ServiceError as e:
+        console.print(f"[yellow]{e}[/]")
+
+
 def display_post(post: Post, current_user: str):
-    author = post.author
-    caption = post.caption
-    like_count = len(post.likes)
-    comment_count = len(post.comments)
-    created_at = datetime.fromisoformat(post.created_at).strftime("%Y-%m-%d %H:%M")
-    
-    panel = Panel(
-        Text(f"{author} @ {created_at}\n\n{caption}\n\n❤ {like_count}   💬 {comment_count}"),
-        title=f"#post{post.id}",
-        border_style="green"
-    )
-    console.print(panel)
-    
-    if post.comments:
-        console.print("💬 comments:")
-        for comment_id in post.comments:
-            comment = next((c for c in comments if c["id"] == comment_id), None)
-            if comment:
-                console.print(f"   {comment['author']}: {comment['text']}")
-    options = [
-        ("1", "like"),
-        ("2", "comment"),
-        ("3", "saved"),
-        ("4", "back")
-    ]
-    
-    table = Table(show_header=False)
-    table.add_column("option", style="cyan")
-    table.add_column("operation")
-    
-    for opt, desc in options:
-        table.add_row(opt, desc)
-    
-    console.print(table)
+    """one post with its comments and its own like/comment/save prompt"""
+    console.print(post_panel(post, current_user))
     
-    choice = Prompt.ask("choose one", choices=["1", "2", "3", "4"])
+    offset = 0
+    while True:
+        #har bar COMMENT_PAGE_SIZE ta comment jadid tar, ba "more comments" ghadimi tar ha
+        page, next_offset = service.post_comments(current_user, post.id, offset)
+        if page and offset == 0:
+            console.print("💬 comments:")
+        for comment in page:
+            console.print(f"   {comment['author']}: {comment['text']}")
+        offset = next_offset
+
+        options = [
+            ("1", "like"),
+            ("2", "comment"),
+            ("3", "saved"),
+            ("4", "back")
+        ]
+        if next_offset is not None:
+            options.append(("5", "more comments"))
+        
+        table = Table(show_header=False)
+        table.add_column("option", style="cyan")
+        table.add_column("operation")
+        
+        for opt, desc in options:
+            table.add_row(opt, desc)
+        
+        console.print(table)
+        
+        choice = Prompt.ask("choose one", choices=[opt for opt, _ in options])
+        if choice != "5":
+            break
     
-    if choice == "1":
-        if current_user in post.likes:
-            post.likes.remove(current_user)
-            console.print("[yellow]you unliked![/]")
-        else:
-            post.likes.append(current_user)
-            console.print("[green]you liked a post![/]")
-        save_data()
-    elif choice == "2":
-        add_comment(post, current_user)
-    elif choice == "3":
-        if post.id not in users[current_user].saved_posts:
-            users[current_user].saved_posts.append(post.id)
-            console.print("[green]post has been saved![/]")
-            save_data()
-        else:
-            console.print("[yellow]this post has already been saved before![/]")
+    if choice in ("1", "2", "3"):
+        act_on_post({"1": "l", "2": "c", "3": "s"}[choice], post, current_user)
     
 def add_comment(post: Post, current_user: str):
     """adding comment to the post"""
     comment_text = Prompt.ask("write your comment ")
-    comment_id = len(comments) + 1
-    comments.append({
-        "id": comment_id,
-        "post_id": post.id,
-        "author": current_user,
-        "text": comment_text,
-        "created_at": datetime.now().isoformat()
-    })
-    post.comments.append(comment_id)
-    save_data()
+    service.comment(current_user, post.id, comment_text)
     console.print("[green]your comment has been added![/]")
     
 def view_profile(current_user: str, profile_user: str):
-    user = users[profile_user]
+    #kasi ke block kardeh profile-esh ro ham neshoon nemidim
+    try:
+        user = service.profile(current_user, profile_user)
+    except ServiceError as e:
+        console.print(f"[yellow]{e}[/]")
+        return
     
     while True:
         console.print(Panel(f"{profile_user} profile", style="blue"))
@@ -382,14 +3392,12 @@ def view_profile(current_user: str, profile_user: str):
         options = []
         
         if profile_user != current_user:
-            if profile_user in users[current_user].following:
-                if profile_user in users[current_user].following:
-                    
-                    options.append(("1", "unfollow"))
+            if service.is_following(current_user, profile_user):
+                options.append(("1", "unfollow"))
             else:
                 options.append(("1", "follow"))
             
-            if profile_user in users[current_user].blocked_users:
+            if service.is_blocked(current_user, profile_user):
                 options.append(("2", "unblock"))
             else:
                 options.append(("2", "block"))
@@ -410,73 +3418,85 @@ def view_profile(current_user: str, profile_user: str):
         choice = Prompt.ask("choose", choices=choices)
         
         if choice == "1" and profile_user != current_user:
-            if profile_user in users[current_user].following:
-                users[current_user].following.remove(profile_user)
-                user.followers.remove(current_user)
+            if service.is_following(current_user, profile_user):
+                service.unfollow(current_user, profile_user)
                 console.print(f"[yellow]you're not following {profile_user} anymore![/]")
             else:
-                if user.is_private:
-                    
-                    if any(req["from_user"] == current_user and req["to_user"] == profile_user for req in follow_requests):
-                        console.print("[yellow]wait for your following request confirmation![/]")
-                    else:
-                        follow_requests.append({
-                            "id": len(follow_requests) + 1,
-                            "from_user": current_user,
-                            "to_user": profile_user,
-                            "status": "pending",
-                            "created_at": datetime.now().isoformat()
-                        })
-                        console.print("[yellow]your request has been sent![/]")
+                try:
+                    status = service.follow(current_user, profile_user)
+                except ServiceError as e:
+                    console.print(f"[yellow]{e}[/]")
+                    continue
+                if status == "pending":
+                    console.print("[yellow]wait for your following request confirmation![/]")
+                elif status == "requested":
+                    console.print("[yellow]your request has been sent![/]")
                 else:
-                    users[current_user].following.append(profile_user)
-                    user.followers.append(current_user)
                     console.print(f"[green]you are following {profile_user} now![/]")
-            save_data()
         elif choice == "2" and profile_user != current_user:
-            if profile_user in users[current_user].blocked_users:
-                users[current_user].blocked_users.remove(profile_user)
+            if service.is_blocked(current_user, profile_user):
+                service.unblock(current_user, profile_user)
                 console.print(f"[green]user {profile_user} has been unblocked[/]")
             else:
-                users[current_user].blocked_users.append(profile_user)
-                
-                #unfollow kardan
-                if profile_user in users[current_user].following:
-                    users[current_user].following.remove(profile_user)
-                    user.followers.remove(current_user)
+                #block kardan unfollow ham mikone
+                service.block(current_user, profile_user)
                 console.print(f"[red]{profile_user} unfollowed![/]")
-            save_data()
         elif choice == "3":
             view_user_posts(current_user, profile_user)
         elif choice == "4":
             return
         
         
+def browse_posts(current_user: str, page_posts, page_size: int = FEED_PAGE_SIZE) -> int:
+    """show posts page by page; page_posts(offset, limit) gives the next visible posts newest
+    first and the offset after them (None at the end). returns how many posts were shown"""
+    offset = shown = 0
+    while True:
+        visible, offset = page_posts(offset, page_size)
+        more = offset is not None
+        shown += len(visible)
+        if not visible:
+            if more:
+                continue
+            return shown
+
+        render_feed_page(visible, current_user)
+        options = ["n", "b"] if more else ["b"]
+        console.print(f"[cyan]{post_actions_hint(visible)}" + (", n: older posts" if more else "") + ", b: back[/]")
+        while True:
+            choice, post = ask_post_action(visible, options, options[0])
+            if post is None:
+                break
+            act_on_post(choice, post, current_user)
+        if choice == "b":
+            return shown
+
 def view_saved_posts(current_user: str):
-    user = users[current_user]
-    saved_posts = [post for post in posts if post.id in user.saved_posts]
+    user = service.get_user(current_user)
     
-    if not saved_posts:
+    if not user.saved_posts:
         console.print("[yellow]no saved posts[/]")
         return
     
     console.print(Panel("Saved posts", style="blue"))
     
-    for post in saved_posts:
-        display_post(post, current_user)
+    #akharin post save shode aval
+    if not browse_posts(current_user, lambda offset, limit: service.saved_posts(current_user, offset, limit)):
+        console.print("[yellow]no saved posts[/]")
         
 def view_user_posts(current_user: str, profile_user: str):
-    user = users[profile_user]
-    user_posts = [post for post in posts if post.author == profile_user]
-    
-    if not user_posts:
+    try:
+        service.check_can_view(current_user, profile_user)
+    except ServiceError as e:
+        console.print(f"[yellow]{e}[/]")
+        return
+    if not service.get_user(profile_user).posts:
         console.print("[yellow]no posts from this user![/]")
         return
     
     console.print(Panel(f"{profile_user}'s posts", style="blue"))
     
-    for post in user_posts:
-        display_post(post, current_user)
+    browse_posts(current_user, lambda offset, limit: service.user_posts(current_user, profile_user, offset, limit))
         
         
 def search_users(current_user: str):
@@ -486,7 +3506,7 @@ def search_users(current_user: str):
     if not query:
         return
     
-    results = [username for username in users if query.lower() in username.lower() and username != current_user]
+    results = service.search(current_user, query)
     
     if not results:
         console.print("[yellow]no users were found![/]")
@@ -494,7 +3514,7 @@ def search_users(current_user: str):
     
     console.print("[cyan]search results:[/]")
     for i, username in enumerate(results, 1):
-        user = users[username]
+        user = service.get_user(username)
         console.print(f"{i}. {username} - followers: {len(user.followers)} - followings: {len(user.following)}")
     
     choice = Prompt.ask("to view profile enter number (0 to go back)", choices=[str(i) for i in range(len(results)+1)])
@@ -507,26 +3527,24 @@ def search_users(current_user: str):
         
         
 def edit_profile(current_user: str):
-    user = users[current_user]
+    user = service.get_user(current_user)
     
     console.print(Panel("edit profile", style="blue"))
     
     new_bio = Prompt.ask("New bio (leave space for no changes)", default=user.bio)
-    user.bio = new_bio
+    service.edit_bio(current_user, new_bio)
     
-    save_data()
     console.print("[green]Profile has been updated sucessfully![/]")
 
 
 
 def privacy_settings(current_user: str):
-    user = users[current_user]
+    user = service.get_user(current_user)
     
     console.print(Panel("privacy setting", style="blue"))
     
-    user.is_private = Confirm.ask("are sure you want to change to private mode?", default=user.is_private)
+    service.set_private(current_user, Confirm.ask("are sure you want to change to private mode?", default=user.is_private))
     
-    save_data()
     status = "private" if user.is_private else "public"
     console.print(f"[green]your account is {status} now![/]")
     
@@ -539,23 +3557,18 @@ def create_post(current_user: str):
     #masir tasvir ra daryaft mikonim ama pardazesh nemikonim
     image_path = Prompt.ask("image path", default="")
     
-    post = Post(current_user, caption, image_path)
-    posts.append(post)
-    users[current_user].posts.append(post.id)
-    
-    save_data()
+    service.create_post(current_user, caption, image_path)
     console.print("[green]post has been uploaded![/]")
     
 def blocked_users(current_user: str):
-    user = users[current_user]
-    
     while True:
         console.print(Panel("blocked users", style="blue"))
         
-        if not user.blocked_users:
+        blocked = service.blocked_users(current_user)
+        if not blocked:
             console.print("[yellow]you blocked no one![/]")
         else:
-            for i, username in enumerate(user.blocked_users, 1):
+            for i, username in enumerate(blocked, 1):
                 console.print(f"{i}. {username}")
         
         options = [
@@ -574,23 +3587,132 @@ def blocked_users(current_user: str):
         
         choice = Prompt.ask("choose", choices=["1", "2"])
         
-        if choice == "1" and user.blocked_users:
+        if choice == "1" and blocked:
             selected = Prompt.ask("enter user number to unblock (enter 0 to go back)", 
-                                choices=[str(i) for i in range(len(user.blocked_users)+1)])
+                                choices=[str(i) for i in range(len(blocked)+1)])
             if selected == "0":
                 continue
             
-            unblocked_user = user.blocked_users[int(selected)-1]
-            user.blocked_users.remove(unblocked_user)
-            save_data()
+            unblocked_user = blocked[int(selected)-1]
+            service.unblock(current_user, unblocked_user)
             console.print(f"[green]{unblocked_user} unblocked![/]")
             
         elif choice == "2":
             return
 
 
+def follow_requests_screen(current_user: str):
+    while True:
+        console.print(Panel("follow requests", style="blue"))
+        
+        pending = service.pending_follow_requests(current_user)
+        if not pending:
+            console.print("[yellow]no pending follow requests![/]")
+            return
+        for i, request in enumerate(pending, 1):
+            console.print(f"{i}. {request['from_user']}")
+        
+        options = [
+            ("1", "approve"),
+            ("2", "reject"),
+            ("3", "approve all"),
+            ("4", "reject all"),
+            ("5", "back")
+        ]
+        
+        table = Table(show_header=False)
+        table.add_column("option", style="cyan")
+        table.add_column("operation")
+        
+        for opt, desc in options:
+            table.add_row(opt, desc)
+        
+        console.print(table)
+        
+        choice = Prompt.ask("choose", choices=["1", "2", "3", "4", "5"])
+        
+        if choice in ("1", "2"):
+            selected = Prompt.ask("enter request number (enter 0 to go back)",
+                                choices=[str(i) for i in range(len(pending)+1)])
+            if selected == "0":
+                continue
+            request = pending[int(selected)-1]
+            resolved = service.resolve_follow_requests(current_user, [request["id"]], approve=choice == "1")
+            if resolved[0]["status"] == "approved":
+                console.print(f"[green]{request['from_user']} is following you now![/]")
+            else:
+                console.print(f"[yellow]request from {request['from_user']} rejected[/]")
+        elif choice in ("3", "4"):
+            resolved = service.resolve_follow_requests(current_user, [request["id"] for request in pending], approve=choice == "3")
+            approved = sum(request["status"] == "approved" for request in resolved)
+            console.print(f"[green]{approved} requests approved, {len(resolved) - approved} rejected![/]")
+        elif choice == "5":
+            return
+
+
+def print_stats(stats: EngagementStats, title: str):
+    summary = stats.summary()
+    table = Table(title=f"{title}: {summary['posts']} posts")
+    table.add_column("")
+    table.add_column("total", justify="right")
+    table.add_column("mean", justify="right")
+    for p in summary["likes_p"]:
+        table.add_column(f"p{p}", justify="right")
+    for name in ("likes", "comments"):
+        table.add_row(name, str(summary[name]), f"{summary[name + '_mean']:.1f}",
+                      *(f"{value:g}" for value in summary[name + "_p"].values()))
+    console.print(table)
+
+    table = Table(title=f"top posts per day, last {STATS_DAYS} days")
+    table.add_column("day")
+    table.add_column("post")
+    table.add_column("❤", justify="right")
+    table.add_column("💬", justify="right")
+    for day, top in stats.since_days(STATS_DAYS).top_per_day():
+        for post_id, likes, comment_count in top:
+            table.add_row(day, f"#post{post_id}", str(likes), str(comment_count))
+            day = ""
+    console.print(table)
+
+
+def stats_screen(current_user: str):
+    if np is None:
+        console.print("[yellow]numpy is not installed, stats are not available[/]")
+        return
+    console.print(Panel("*MY STATS*", style="blue"))
+    #faghat post haye khodesh decode mishan; scan kamel faghat baraye dastoor "stats" hast
+    print_stats(EngagementStats.build(post_ids=users[current_user].posts), "my posts")
+
+    table = Table(title="follower growth")
+    table.add_column("day")
+    table.add_column("new", justify="right")
+    table.add_column("followers", justify="right")
+    for day, new, total in follower_growth(current_user):
+        table.add_row(day, f"+{new}" if new else "", str(total))
+    console.print(table)
+    Prompt.ask("press enter to go back", default="")
+
+
+def stats_report():
+    """global engagement stats for python finallll.py stats"""
+    if np is None:
+        console.print("[red]numpy is not installed, stats are not available[/]")
+        return
+    stats = EngagementStats.build()
+    print_stats(stats, "all posts")
+    table = Table(title="top authors")
+    table.add_column("author")
+    table.add_column("posts", justify="right")
+    table.add_column("❤", justify="right")
+    table.add_column("💬", justify="right")
+    for author, post_count, likes, comment_count in stats.per_author():
+        table.add_row(author, str(post_count), str(likes), str(comment_count))
+    console.print(table)
+
+
 def main():
     initialize_data_directory()
+    open_storage()
     load_data()
     console.print(Panel("instagram", style= "bold blue"))
     while True:
@@ -620,7 +3742,20 @@ def main():
                 home_screen(username)
         elif choice == "3":
             console.print("[green]Goodbye![/]")
+            storage.close()
             break
     
 if __name__ == "__main__":
-    main()        
\ No newline at end of file
+    if len(sys.argv) == 3 and sys.argv[1] == "convert":
+        #python finallll.py convert binary|json
+        initialize_data_directory()
+        convert_snapshot(sys.argv[2])
+    elif len(sys.argv) == 2 and sys.argv[1] == "stats":
+        #python finallll.py stats
+        initialize_data_directory()
+        open_storage()
+        load_data()
+        stats_report()
+        storage.close()
+    else:
+        main()        
\ No newline at end of file
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import finallll as app
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """an empty data directory with the json backend loaded, like a first start"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, "user_ids", app.UserIds())
+    app.initialize_data_directory()
+    app.open_storage("json", False)
+    app.load_data()
+    yield app
+    app.storage.close()
@@ -0,0 +1,33 @@
+def register(service, *names):
+    for name in names:
+        service.register(name, f"{name}@example.com", "secret1")
+
+
+def test_block_rejects_pending_requests_both_ways(data_dir):
+    service = data_dir.service
+    register(service, "bob", "carol")
+    service.set_private("carol", True)
+    service.set_private("bob", True)
+    assert service.follow("bob", "carol") == "requested"
+    assert service.follow("carol", "bob") == "requested"
+    service.block("carol", "bob")
+    assert service.pending_follow_requests("carol") == []
+    assert service.pending_follow_requests("bob") == []
+    assert service.follow_request_count("carol") == 0
+
+
+def test_approve_skips_requests_between_blocked_users(data_dir):
+    app = data_dir
+    service = app.service
+    register(service, "bob", "carol", "dave")
+    service.set_private("carol", True)
+    service.follow("bob", "carol")
+    service.follow("dave", "carol")
+    #block-e ghabl az in fix request ro pending gozashte
+    app.graph.block("carol", "bob")
+    ids = [request["id"] for request in service.pending_follow_requests("carol")]
+    resolved = service.resolve_follow_requests("carol", ids, approve=True)
+    assert [(request["from_user"], request["status"]) for request in resolved] == [
+        ("bob", "rejected"), ("dave", "approved")]
+    assert not service.is_following("bob", "carol")
+    assert service.is_following("dave", "carol")
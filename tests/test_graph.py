@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+import finallll as app
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture(autouse=True)
+def fresh_ids(monkeypatch):
+    monkeypatch.setattr(app, "user_ids", app.UserIds())
+
+
+@pytest.mark.parametrize("adjacency", [app.IdSetAdjacency, app.CsrAdjacency])
+def test_friends_of_friends_on_sparse_graph(adjacency):
+    graph = app.SocialGraph(adjacency)
+    #bob, dave va erin hich kasi ro follow nemikonan, pas to CSR row nadashtan
+    graph.follow("alice", "bob")
+    assert graph.friends_of_friends("alice") == []
+    graph.follow("alice", "carol")
+    graph.follow("carol", "dave")
+    graph.follow("carol", "erin")
+    graph.follow("bob", "erin")
+    assert graph.friends_of_friends("alice") == ["erin", "dave"]
+    assert graph.friends_of_friends("erin") == []
+
+
+def test_csr_degree_matches_row_through_merges(monkeypatch):
+    monkeypatch.setattr(app, "CSR_MERGE_EDGES", 8)
+    adjacency = app.CsrAdjacency()
+    rnd = random.Random(1)
+    for _ in range(2000):
+        user_id, other_id = rnd.randrange(30), rnd.randrange(40)
+        if rnd.random() < 0.6:
+            adjacency.add(user_id, other_id)
+        else:
+            adjacency.discard(user_id, other_id)
+        assert adjacency.degree(user_id) == len(adjacency.row(user_id))
+    assert [adjacency.degree(user_id) for user_id in range(45)] == [len(adjacency.row(user_id)) for user_id in range(45)]
+
+
+@pytest.mark.parametrize("likes", [range(0, 300000, 3), range(5)])
+def test_csr_row_and_bitmap_intersection(likes):
+    row = app.CsrRow(np.array([0, 3, 4, 9, 12, 299997], dtype=np.uint32))
+    bitmap = app.IdBitmap(likes)
+    expected = sorted(set(row) & set(likes))
+    assert sorted(row & bitmap) == expected
+    assert sorted(bitmap & row) == expected
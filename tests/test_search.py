@@ -0,0 +1,17 @@
+def register(service, *names):
+    for name in names:
+        service.register(name, f"{name}@example.com", "secret1")
+
+
+def test_equal_scores_rank_shorter_names_first(data_dir):
+    service = data_dir.service
+    register(service, "viewer", "alicia", "alice2", "alice")
+    assert service.search("viewer", "ali") == ["alice", "alice2", "alicia"]
+    assert service.search("viewer", "alcie")[:2] == ["alice", "alice2"]
+
+
+def test_followers_outrank_name_length(data_dir):
+    service = data_dir.service
+    register(service, "viewer", "alice", "alicia", "fan1")
+    service.follow("fan1", "alicia")
+    assert service.search("viewer", "ali") == ["alicia", "alice"]
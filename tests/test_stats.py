@@ -0,0 +1,25 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+
+def test_stats_for_own_posts_match_the_full_scan(data_dir):
+    app = data_dir
+    service = app.service
+    for name in ("alice", "bob"):
+        service.register(name, f"{name}@example.com", "secret1")
+    for i in range(5):
+        mine = service.create_post("alice", f"mine {i}")
+        service.create_post("bob", f"other {i}")
+        for _ in range(i):
+            service.comment("bob", mine.id, "nice")
+        if i % 2:
+            service.toggle_like("bob", mine.id)
+
+    own = app.EngagementStats.build(post_ids=app.users["alice"].posts)
+    scanned = app.EngagementStats.build().of_author("alice")
+    order = scanned.post_ids.argsort()
+    assert own.post_ids.tolist() == scanned.post_ids[order].tolist()
+    assert own.like_counts.tolist() == scanned.like_counts[order].tolist()
+    assert own.comment_counts.tolist() == scanned.comment_counts[order].tolist() == [0, 1, 2, 3, 4]
+    assert own.summary() == scanned.summary()
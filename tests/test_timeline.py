@@ -0,0 +1,30 @@
+import pytest
+
+import finallll as app
+
+
+def register(service, *names):
+    for name in names:
+        service.register(name, f"{name}@example.com", "secret1")
+
+
+def feed_captions(service, username):
+    page, _ = service.feed(username)
+    return [post.caption for post in page]
+
+
+@pytest.mark.parametrize("drop", ["unfollow", "block"])
+def test_posts_made_while_celebrity_stay_in_feed_after_dropping_below(data_dir, monkeypatch, drop):
+    monkeypatch.setattr(app, "CELEBRITY_FOLLOWERS", 2)
+    service = app.service
+    register(service, "star", "fan1", "fan2")
+    service.follow("fan1", "star")
+    assert feed_captions(service, "fan1") == []
+    service.follow("fan2", "star")
+    service.create_post("star", "while famous")
+    assert feed_captions(service, "fan1") == ["while famous"]
+    if drop == "unfollow":
+        service.unfollow("fan2", "star")
+    else:
+        service.block("star", "fan2")
+    assert feed_captions(service, "fan1") == ["while famous"]